@@ -1,20 +1,74 @@
-import pyautogui
 import cv2
 import numpy as np
 from PIL import Image
-from sklearn.cluster import DBSCAN
 import time
 import csv
 import os
+import sys
+import copy
+import threading
+import multiprocessing
+from collections import deque
 from datetime import datetime
 import argparse
+import sqlite3
+import json
+import contextlib
+import weakref
 
-# Set PyAutoGUI safety features
-pyautogui.PAUSE = 0.02  # Further reduced pause for speed
-pyautogui.FAILSAFE = True  # Move mouse to corner to abort
+from capture import ScreenCapture, RecordingCapture, ReplayCapture
+from inputs import PyAutoGUIInput, ArbitratedInput, RecordingInput, InputDispatcher, wait_result
+from profiling import Profiler
+from events import EventLog
+import stats_db
+from scheduler import WinEstimator
+from buffers import buffer_pool
+
+try:
+    import pyautogui
+except Exception:  # No display (headless simulation or replay), see simulator.py
+    pyautogui = None
+
+if pyautogui is not None:
+    # Set PyAutoGUI safety features
+    pyautogui.PAUSE = 0  # Clicks are spaced by the input dispatcher (CLICK_DELAY) instead
+    pyautogui.FAILSAFE = True  # Move mouse to corner to abort
 
 #python attack.py --username John --power 484Fire --searches 20 --delay 3
 
+class SystemClock:
+    """
+    Real time. The simulator swaps in a virtual clock so sleeps do not block.
+    """
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+
+clock = SystemClock()
+
+# Per-stage timing spans; the clock is looked up per call so a swapped-in clock is used
+profiler = Profiler(lambda: clock.perf_counter())
+
+# Where frames come from; swapped for RecordingCapture/ReplayCapture when needed
+capture_backend = ScreenCapture(buffer_pool)
+
+# Where clicks go; swapped for the simulator in headless runs
+input_backend = PyAutoGUIInput() if pyautogui is not None else None
+
+# Thread that sends the clicks, see input_dispatcher()
+dispatcher = None
+
+# Per-attack event stream (events.py); None disables it, e.g. in the simulator
+event_log = None
+EVENT_LOG_FILE = 'mine_attack_events.jsonl'
+
 # Statistics tracking
 stats = {
     'start_time': '',
@@ -28,21 +82,207 @@ stats = {
     'troops_returned': 0
 }
 
-def save_statistics_to_csv(username, power):
+# Deadlines (seconds) for each kind of change-driven wait
+wait_timeouts = {
+    'button': 2.5,             # a dialog button appearing or disappearing
+    'attack_result': 1.0,      # the attacked mine turning green after DEPART (a loss shows no change)
+    'search_result': 2.5,      # new mines appearing after SEARCH
+    'search_unchanged': 1.0    # the mine area showing no change at all after SEARCH (a same-looking set)
+}
+
+WAIT_POLL_INTERVAL = 0.02   # Time between cheap change checks
+WAIT_MAX_QUIET = 0.5        # Run the detector at least this often even without change
+CLICK_DELAY = 0.03          # Minimum time between clicks so the game registers each one
+
+# HSV ranges of every color the bot looks for, as (lower, upper) boxes.
+# All of them are folded into one lookup table, see build_color_lut().
+COLOR_RANGES = {
+    'tan':           [((15, 50, 100), (40, 200, 255))],
+    'red_mark':      [((0, 120, 120), (10, 255, 255)), ((170, 120, 120), (180, 255, 255))],
+    'green_mark':    [((35, 60, 60), (85, 255, 255))],
+    'red_button':    [((0, 100, 100), (10, 255, 255)), ((170, 100, 100), (180, 255, 255))],
+    'green_button':  [((40, 80, 80), (80, 255, 255))],
+    'yellow_button': [((20, 100, 100), (35, 255, 255))],
+    'blue_button':   [((95, 120, 150), (115, 255, 255))]
+}
+
+MARK_MIN_AREA = {'red': 150, 'green': 100}
+BUTTON_MIN_AREA = {'red': 1000, 'green': 1000, 'yellow': 1000, 'blue': 3000}
+
+# Morphology kernels used to clean up color masks
+MARK_KERNEL = np.ones((5,5), np.uint8)
+BUTTON_KERNEL = np.ones((7,7), np.uint8)
+
+# Coarse-to-fine detection: colors are segmented on a frame downscaled by this
+# factor and only the windows around candidates are segmented at full resolution
+DETECTION_SCALE = 1        # 1 = full resolution only; 2 or 4 with --coarse-scale
+COARSE_AREA_SLACK = 0.5    # Candidates need only this fraction of the (scaled) minimum area
+coarse_kernels = {}        # Downscaled morphology kernels by size
+
+# Last confirmed screen position per button color, reused while the window stays put
+button_cache = {}
+
+BUTTON_ROI_SIZE = (240, 120)   # Area checked around a cached button position
+
+# Learned button looks per window size ('WxH' -> color -> offset in the window and BGR patch),
+# kept on disk so later sessions skip the color search; see confirm_button()
+button_templates = {}
+BUTTON_TEMPLATE_FILE = 'button_templates.json'   # None keeps templates in memory only
+template_file_lock = None   # Inter-process lock around the template file with --instances
+BUTTON_MATCH_TOLERANCE = 12.0   # Mean absolute BGR difference for a template hit
+
+# Screen region searched for the game window (None = whole screen); set per worker in multi-instance runs
+window_search_area = None
+
+# Game window layout, detected once and reused while the window stays put
+window_cache = {
+    'bounds': None,
+    'mine_area': None,
+    'dialog_area': None,
+    'search_area': None,
+    'sample_points': None,
+    'sample_colors': None
+}
+
+def build_color_lut(color_ranges):
     """
-    Save statistics to CSV file with username and timestamp.
+    Build per-channel lookup tables that label a pixel with one bit per color.
+    A color's boxes may differ in hue only (e.g. red's two hue bands), so every
+    color is the AND of an H, S and V table and one pass labels all colors at once.
+    Returns (lut, bits) where lut has shape (3, 256) and bits maps color -> bit.
     """
-    csv_file = 'mine_attack_statistics.csv'
-    file_exists = os.path.isfile(csv_file)
+    dtype = np.uint8 if len(color_ranges) <= 8 else np.uint16
+    lut = np.zeros((3, 256), dtype=dtype)
+    bits = {}
+    
+    for index, (color, boxes) in enumerate(color_ranges.items()):
+        bit = 1 << index
+        bits[color] = bit
+        
+        for (lower, upper) in boxes:
+            if (lower[1:], upper[1:]) != (boxes[0][0][1:], boxes[0][1][1:]):
+                raise ValueError(f"Ranges for {color} must share saturation and value bounds")
+            lut[0, lower[0]:upper[0] + 1] |= bit
+        
+        lut[1, boxes[0][0][1]:boxes[0][1][1] + 1] |= bit
+        lut[2, boxes[0][0][2]:boxes[0][1][2] + 1] |= bit
     
-    # Prepare data
+    return lut, bits
+
+
+color_lut, color_bits = build_color_lut(COLOR_RANGES)
+
+
+def classify_pixels(hsv, lut=None):
+    """
+    Label every pixel of an HSV image with the bits of all colors it matches.
+    """
+    if lut is None:
+        lut = color_lut
+    with profiler.span('segmentation'):
+        shape = hsv.shape[:2]
+        channel = buffer_pool.take(shape)
+        looked_up = buffer_pool.take(shape, lut.dtype)
+        labels = cv2.LUT(cv2.extractChannel(hsv, 0, dst=channel), lut[0], dst=buffer_pool.take(shape, lut.dtype))
+        for index in (1, 2):
+            cv2.LUT(cv2.extractChannel(hsv, index, dst=channel), lut[index], dst=looked_up)
+            cv2.bitwise_and(labels, looked_up, dst=labels)
+    return labels
+
+
+def color_mask(labels, color):
+    """
+    Extract a 0/255 mask for one color from a label map.
+    """
+    bit = color_bits[color]
+    masked = cv2.bitwise_and(labels, bit, dst=buffer_pool.take(labels.shape, labels.dtype))
+    return cv2.compare(masked, 0, cv2.CMP_GT, dst=buffer_pool.take(labels.shape))
+
+
+# Learned mine slot layout. Positions are fractions of the game window size so
+# they survive the window moving; see learn_mine_slots().
+mine_slots = {
+    'positions': [],       # (fx, fy) per slot once learned
+    'observations': []     # normalized mark centers from recent full detections
+}
+
+SLOT_LEARN_DETECTIONS = 3   # Full detections needed before slots are trusted
+SLOT_MAX = 4                # The advanced mithril screen shows at most four mines
+SLOT_PATCH_RADIUS = 45      # Half size (px) of the patch classified per slot
+SLOT_CHECK_STRIDE = 4       # Subsampling used when checking for marks outside slots
+MATCH_RADIUS = 60           # A mark within this many px is the same mine
+MARK_CLUSTER_EPS = 45       # Mark pieces closer than this many px form one mark
+MINE_CLICK_OFFSET = 30      # The mine structure sits this many px below its mark
+MIN_WIN_CHANCE = 0.15       # Search early when no remaining mine is estimated above this
+
+
+def open_event_log(username, power, lock=None, session=None, start_offset=None):
+    """
+    Start this session's records in the shared event log, or continue the
+    records of an earlier session id (--resume) that started at start_offset.
+    """
+    global event_log
+    event_log = EventLog(EVENT_LOG_FILE, lock, now=lambda: clock.time(), session=session, start_offset=start_offset)
+    log_event('session_resume' if session else 'session_start', username=username, power=power, pid=os.getpid())
+
+
+def close_event_log(outcome='finished'):
+    """
+    Mark the session as finished (or interrupted) and flush the log to disk.
+    The closed log can still be summarized by save_statistics_to_csv().
+    """
+    if event_log is None or event_log.closed:
+        return
+    log_event('session_end', outcome=outcome)
+    event_log.close()
+
+
+def session_row(username, power):
+    """
+    The session's summary: stats, with the totals taken from the event log when one is open.
+    """
     stats['username'] = username
     stats['power'] = power
-    stats['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    stats['end_time'] = datetime.fromtimestamp(clock.time()).strftime('%Y-%m-%d %H:%M:%S')
+    
+    row = dict(stats)
+    if event_log is not None:
+        summary = event_log.summary()
+        for key in ('total_attacks', 'successful_attacks', 'failed_attacks', 'searches_performed', 'troops_returned'):
+            row[key] = summary[key]
+    return row
+
+
+def store_session(row):
+    """
+    Save a session summary to the SQLite store; a resumed session replaces its earlier row.
+    """
+    try:
+        stats_db.record_session(row, event_log)
+        print(f"✓ Session stored in {stats_db.DB_FILE}")
+    except sqlite3.Error as e:
+        print(f"✗ Could not store session in {stats_db.DB_FILE}: {e}")
+
+
+def save_statistics_to_csv(username, power):
+    """
+    Save statistics to CSV file with username and timestamp, and to the SQLite store.
+    Totals come from the event log when one is open, so the row matches it.
+    """
+    csv_file = stats_db.CSV_FILE
+    file_exists = os.path.isfile(csv_file)
+    
+    # Keep appending with the delimiter the file already uses (';' for new files)
+    delimiter = ';'
+    if file_exists:
+        with open(csv_file, encoding='utf-8-sig') as f:
+            delimiter = stats_db.sniff_delimiter(f.readline())
+    
+    row = session_row(username, power)
     
     # Calculate success rate
-    if stats['total_attacks'] > 0:
-        success_rate = stats['successful_attacks'] / stats['total_attacks'] * 100
+    if row['total_attacks'] > 0:
+        success_rate = row['successful_attacks'] / row['total_attacks'] * 100
     else:
         success_rate = 0.0
     
@@ -51,7 +291,7 @@ def save_statistics_to_csv(username, power):
         fieldnames = ['username', 'power', 'date_time', 'start_time', 'end_time', 'total_attacks', 
                      'successful_attacks', 'failed_attacks', 'success_rate', 
                      'searches_performed', 'troops_returned']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=delimiter)
         
         # Write header if file is new
         if not file_exists:
@@ -59,49 +299,214 @@ def save_statistics_to_csv(username, power):
         
         # Write data
         writer.writerow({
-            'username': stats['username'],
-            'power': stats['power'],
-            'date_time': stats['end_time'],
-            'start_time': stats['start_time'],
-            'end_time': stats['end_time'],
-            'total_attacks': stats['total_attacks'],
-            'successful_attacks': stats['successful_attacks'],
-            'failed_attacks': stats['failed_attacks'],
+            'username': row['username'],
+            'power': row['power'],
+            'date_time': row['end_time'],
+            'start_time': row['start_time'],
+            'end_time': row['end_time'],
+            'total_attacks': row['total_attacks'],
+            'successful_attacks': row['successful_attacks'],
+            'failed_attacks': row['failed_attacks'],
             'success_rate': f"{success_rate:.1f}%",
-            'searches_performed': stats['searches_performed'],
-            'troops_returned': stats['troops_returned']
+            'searches_performed': row['searches_performed'],
+            'troops_returned': row['troops_returned']
         })
     
     print(f"\n✓ Statistics saved to {csv_file}")
+    store_session(row)
+
+
+class Frame:
+    """
+    A single screen capture shared by every detector within one decision tick.
+    HSV conversion and crops are computed lazily and cached on the frame.
+    """
+
+    def __init__(self, bgr, origin=(0, 0), timestamp=None, region=None):
+        self.bgr = bgr
+        self.origin = origin
+        self.timestamp = clock.time() if timestamp is None else timestamp
+        self.region = region  # None for a full-screen capture
+        self._hsv = None
+        self._labels = None
+        self._crops = {}
+        self._scaled = {}
+        self._parent = None
+
+    def parent_view(self, name):
+        """
+        The parent frame's cached array (e.g. '_hsv') cut to this crop, or None.
+        """
+        if self._parent is None:
+            return None
+        ref, rows, cols = self._parent
+        parent = ref()
+        if parent is None or getattr(parent, name) is None:
+            return None
+        return getattr(parent, name)[rows, cols]
 
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            # Reuse the parent's conversion instead of converting again
+            self._hsv = self.parent_view('_hsv')
+            if self._hsv is None:
+                with profiler.span('hsv'):
+                    self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV, dst=buffer_pool.take(self.bgr.shape))
+        return self._hsv
+
+    @property
+    def labels(self):
+        """
+        Color label map of the frame, see classify_pixels().
+        """
+        if self._labels is None:
+            self._labels = self.parent_view('_labels')
+            if self._labels is None:
+                self._labels = classify_pixels(self.hsv)
+        return self._labels
+
+    def crop(self, region):
+        """
+        Return the sub-frame for a screen region (x, y, w, h), cached per region.
+        """
+        region = tuple(region)
+        if region not in self._crops:
+            x, y, w, h = region
+            ox, oy = self.origin
+            left, top = max(x - ox, 0), max(y - oy, 0)
+            rows = slice(top, max(y - oy + h, 0))
+            cols = slice(left, max(x - ox + w, 0))
+            sub = Frame(self.bgr[rows, cols], (ox + left, oy + top), self.timestamp, region)
+            # A weak link, so frames are freed (and their pooled buffers reused) as soon as they are dropped
+            sub._parent = (weakref.ref(self), rows, cols)
+            self._crops[region] = sub
+        return self._crops[region]
+
+    def scaled(self, scale):
+        """
+        Every scale-th pixel of this frame in both directions (cached), for coarse
+        detection: pixel (i, j) of the result is screen pixel origin + (i, j) * scale.
+        Sampling keeps colors pure, where averaging would blend mark edges into
+        the background. Crops cut their samples out of their parent's.
+        """
+        if scale not in self._scaled:
+            parent = self._parent[0]() if self._parent is not None else None
+            if parent is not None:
+                coarse = parent.scaled(scale)
+                (ox, oy), (cx, cy) = self.origin, coarse.origin
+                height, width = self.bgr.shape[:2]
+                # Only the samples that fall inside this crop
+                cols = slice(-((cx - ox) // scale), -((cx - ox - width) // scale))
+                rows = slice(-((cy - oy) // scale), -((cy - oy - height) // scale))
+                small = Frame(coarse.bgr[rows, cols], (cx + cols.start * scale, cy + rows.start * scale), self.timestamp)
+                small._parent = (weakref.ref(coarse), rows, cols)
+            else:
+                with profiler.span('downscale'):
+                    sampled = self.bgr[::scale, ::scale]
+                    bgr = buffer_pool.take(sampled.shape)
+                    np.copyto(bgr, sampled)
+                small = Frame(bgr, self.origin, self.timestamp)
+            self._scaled[scale] = small
+        return self._scaled[scale]
 
-def find_game_window():
+
+def capture_frame(region=None):
+    """
+    Capture a screen region (or the whole screen) and wrap it in a Frame.
+    """
+    with profiler.span('capture'):
+        bgr, origin = capture_backend.grab(region)
+    return Frame(bgr, origin, region=region)
+
+
+def frame_covers(frame, region):
+    """
+    True if the frame was captured for a region that contains this one.
+    """
+    if frame.region is None:
+        return True
+    x, y, w, h = region
+    fx, fy, fw, fh = frame.region
+    return fx <= x and fy <= y and x + w <= fx + fw and y + h <= fy + fh
+
+
+def find_game_window(frame=None):
     """
     Detect the LDPlayer game window boundaries.
     """
-    screenshot = pyautogui.screenshot()
-    screenshot_np = np.array(screenshot)
-    screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-    
-    # Convert to HSV to detect the yellow/tan game background
-    hsv = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2HSV)
+    if frame is None:
+        frame = capture_frame()
+    screenshot_cv = frame.bgr
     
-    # Detect the tan/yellow game area
-    lower_tan = np.array([15, 50, 100])
-    upper_tan = np.array([40, 200, 255])
+    # The largest tan/yellow area should be the game area
+    regions = largest_tan_regions(frame)
+    if regions:
+        return regions[0], screenshot_cv
     
-    mask = cv2.inRange(hsv, lower_tan, upper_tan)
+    return None, screenshot_cv
+
+
+def find_game_windows(frame=None, count=1):
+    """
+    Detect up to `count` game windows (the largest tan regions), sorted left to right.
+    """
+    if frame is None:
+        frame = capture_frame()
     
-    # Find contours
+    return sorted(largest_tan_regions(frame, count))
+
+
+def largest_tan_regions(frame, count=1):
+    """
+    Bounding rectangles (screen coordinates) of the largest tan regions, largest first.
+    With DETECTION_SCALE > 1 they are found on the downscaled frame and their
+    edges are refined at full resolution.
+    """
+    scale = DETECTION_SCALE
+    source = frame.scaled(scale) if scale > 1 else frame
+    mask = color_mask(source.labels, 'tan')
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
-    if contours:
-        # Get the largest contour (should be the game area)
-        largest_contour = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        return (x, y, w, h), screenshot_cv
-    
-    return None, screenshot_cv
+    largest = sorted(contours, key=cv2.contourArea, reverse=True)[:count]
+    ox, oy = source.origin
+    regions = []
+    for contour in largest:
+        x, y, w, h = cv2.boundingRect(contour)
+        if scale > 1:
+            regions.append(refine_bounds(frame, (x * scale + ox, y * scale + oy, w * scale, h * scale), scale))
+        else:
+            regions.append((x + ox, y + oy, w, h))
+    return regions
+
+
+def refine_bounds(frame, rough, scale):
+    """
+    Move each edge of a rectangle found at 1/scale resolution to the outermost
+    tan pixel in a thin full-resolution strip along it.
+    """
+    x, y, w, h = rough
+    margin = 2 * scale
+    
+    def tan_extent(strip, axis):
+        # First and one past the last row (axis=1) or column (axis=0) with tan pixels
+        sub = frame.crop(strip)
+        found = np.flatnonzero(color_mask(sub.labels, 'tan').any(axis=axis))
+        if len(found) == 0:
+            return None
+        offset = sub.origin[0] if axis == 0 else sub.origin[1]
+        return found[0] + offset, found[-1] + 1 + offset
+    
+    left = tan_extent((x - margin, y, 2 * margin, h), 0)
+    right = tan_extent((x + w - margin, y, 2 * margin, h), 0)
+    top = tan_extent((x, y - margin, w, 2 * margin), 1)
+    bottom = tan_extent((x, y + h - margin, w, 2 * margin), 1)
+    
+    x0 = int(left[0]) if left else x
+    x1 = int(right[1]) if right else x + w
+    y0 = int(top[0]) if top else y
+    y1 = int(bottom[1]) if bottom else y + h
+    return (x0, y0, x1 - x0, y1 - y0)
 
 
 def get_mine_area(game_bounds):
@@ -124,386 +529,1795 @@ def get_mine_area(game_bounds):
     return (mine_x, mine_y, mine_w, mine_h)
 
 
-def adjust_mine_click_position(red_mark_position, offset_y=30):
+def get_dialog_area(game_bounds):
+    """
+    Calculate the central dialog area where ATTACK/DEPART/RETURN buttons appear.
+    """
+    x, y, w, h = game_bounds
+    
+    dialog_x = x + int(w * 0.2)
+    dialog_y = y + int(h * 0.25)
+    dialog_w = int(w * 0.6)
+    dialog_h = int(h * 0.5)
+    
+    return (dialog_x, dialog_y, dialog_w, dialog_h)
+
+
+def get_search_area(game_bounds):
+    """
+    Calculate the bottom strip of the game window where the SEARCH button is.
+    """
+    x, y, w, h = game_bounds
+    return (x, y + int(h * 0.7), w, int(h * 0.3))
+
+
+def get_border_sample_points(game_bounds, per_side=6):
+    """
+    Pick a few pixels just inside the window edges, used to revalidate cached bounds.
+    """
+    x, y, w, h = game_bounds
+    inset_x = max(int(w * 0.02), 1)
+    inset_y = max(int(h * 0.02), 1)
+    
+    xs = np.linspace(x + inset_x, x + w - 1 - inset_x, per_side).astype(int)
+    ys = np.linspace(y + inset_y, y + h - 1 - inset_y, per_side).astype(int)
+    
+    points = [(px, ys[0]) for px in xs] + [(px, ys[-1]) for px in xs]
+    points += [(xs[0], py) for py in ys[1:-1]] + [(xs[-1], py) for py in ys[1:-1]]
+    return np.array(points)
+
+
+def sample_pixels(frame, points):
+    """
+    Read BGR values of absolute screen points from a frame.
+    Returns None if any point falls outside the frame.
+    """
+    ox, oy = frame.origin
+    cols = points[:, 0] - ox
+    rows = points[:, 1] - oy
+    height, width = frame.bgr.shape[:2]
+    if cols.min() < 0 or rows.min() < 0 or cols.max() >= width or rows.max() >= height:
+        return None
+    return frame.bgr[rows, cols].astype(np.int16)
+
+
+def cache_game_window(game_bounds, frame):
+    """
+    Store the window bounds and precompute the areas derived from them.
+    """
+    points = get_border_sample_points(game_bounds)
+    window_cache['bounds'] = game_bounds
+    window_cache['mine_area'] = get_mine_area(game_bounds)
+    window_cache['dialog_area'] = get_dialog_area(game_bounds)
+    window_cache['search_area'] = get_search_area(game_bounds)
+    window_cache['sample_points'] = points
+    window_cache['sample_colors'] = sample_pixels(frame, points)
+
+
+def window_still_valid(frame, tolerance=40, min_match=0.8):
+    """
+    Cheap check that the cached window has not moved: compare the border
+    sample pixels against the colors recorded when the bounds were detected.
+    """
+    reference = window_cache['sample_colors']
+    if reference is None:
+        return False
+    
+    current = sample_pixels(frame, window_cache['sample_points'])
+    if current is None:
+        return False
+    
+    matches = np.abs(current - reference).max(axis=1) <= tolerance
+    return matches.mean() >= min_match
+
+
+def get_game_layout(frame=None, revalidate=True):
+    """
+    Return the cached game window layout (bounds, mine/dialog/search areas).
+    Full window detection only runs when nothing is cached or the border check fails.
+    """
+    cached = window_cache['bounds'] is not None
+    if cached and not revalidate:
+        return window_cache
+    
+    if frame is None:
+        # Only the window itself is needed to check the border samples
+        frame = capture_frame(window_cache['bounds'])
+    
+    if cached and window_still_valid(frame):
+        return window_cache
+    
+    if frame.region != window_search_area:
+        # The window may have moved outside the captured region
+        frame = capture_frame(window_search_area)
+    
+    game_bounds, _ = find_game_window(frame)
+    if game_bounds is None:
+        window_cache['bounds'] = None
+        return None
+    
+    cache_game_window(game_bounds, frame)
+    return window_cache
+
+
+def adjust_mine_click_position(red_mark_position, offset_y=None):
     """
     Adjust the click position from red X mark to the actual mine structure below it.
     """
+    if offset_y is None:
+        offset_y = MINE_CLICK_OFFSET
     x, y = red_mark_position
     adjusted_y = y + offset_y
     return (x, adjusted_y)
 
 
-def detect_colored_marks(game_bounds, mine_area, color_name, lower_hsv1, upper_hsv1, lower_hsv2=None, upper_hsv2=None, min_area=150):
+def find_blobs(mask, min_area=0):
+    """
+    Label connected regions of a mask and return the areas and centroids
+    (as NumPy arrays) of those larger than min_area.
+    """
+    with profiler.span('blobs'):
+        _, _, blob_stats, centroids = cv2.connectedComponentsWithStats(
+            mask, labels=buffer_pool.take(mask.shape, np.int32), connectivity=8)
+    
+    # Row 0 is the background
+    areas = blob_stats[1:, cv2.CC_STAT_AREA]
+    centroids = centroids[1:]
+    keep = areas > min_area
+    return areas[keep], centroids[keep]
+
+
+def coarse_kernel(kernel, scale):
+    size = max(kernel.shape[0] // scale, 1) | 1
+    if size not in coarse_kernels:
+        coarse_kernels[size] = np.ones((size, size), np.uint8)
+    return coarse_kernels[size]
+
+
+def coarse_candidates(frame, color, min_area, kernel, scale):
+    """
+    Screen regions (x, y, w, h) of a frame that may hold a blob of color larger
+    than min_area, found on the frame downscaled by scale. Each region covers
+    its candidate plus a margin for the full-resolution clean-up; overlapping
+    regions are merged so no blob is counted twice.
+    """
+    small = frame.scaled(scale)
+    mask = color_mask(small.labels, color)
+    with profiler.span('morphology'):
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, coarse_kernel(kernel, scale), dst=buffer_pool.take(mask.shape))
+    with profiler.span('blobs'):
+        _, _, blob_stats, _ = cv2.connectedComponentsWithStats(
+            mask, labels=buffer_pool.take(mask.shape, np.int32), connectivity=8)
+    
+    # Boxes in frame pixels; small pixel (x, y) samples frame pixel offset + (x, y) * scale
+    dx, dy = small.origin[0] - frame.origin[0], small.origin[1] - frame.origin[1]
+    margin = kernel.shape[0] + scale
+    height, width = frame.bgr.shape[:2]
+    boxes = []
+    for x, y, w, h, area in blob_stats[1:].tolist():
+        if area * scale * scale <= min_area * COARSE_AREA_SLACK:
+            continue
+        boxes.append([max(dx + x * scale - margin, 0), max(dy + y * scale - margin, 0),
+                      min(dx + (x + w) * scale + margin, width), min(dy + (y + h) * scale + margin, height)])
+    
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    
+    ox, oy = frame.origin
+    return [(left + ox, top + oy, right - left, bottom - top) for left, top, right, bottom in boxes]
+
+
+def find_mark_points(labels, color, min_area=150):
+    """
+    Take one color out of a label map and return the centers of large enough
+    colored regions, together with the cleaned-up mask.
+    """
+    # Color detection
+    mask = color_mask(labels, color)
+    
+    # Clean up the mask
+    with profiler.span('morphology'):
+        closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MARK_KERNEL, dst=buffer_pool.take(mask.shape))
+        mask = cv2.morphologyEx(closed, cv2.MORPH_OPEN, MARK_KERNEL, dst=mask)
+    
+    # Get all colored region centers
+    _, centroids = find_blobs(mask, min_area)
+    colored_points = [tuple(point) for point in centroids.astype(int).tolist()]
+    
+    return colored_points, mask
+
+
+def cluster_points(points, eps=45):
+    """
+    Group points that are connected through neighbours at most eps apart.
+    Same result as DBSCAN(eps, min_samples=1): points are hashed into an eps-sized
+    grid, only neighbouring cells are compared, and groups are merged with union-find.
+    Returns one label per point, numbered in order of first appearance.
+    """
+    points = [(float(px), float(py)) for px, py in points]
+    parent = list(range(len(points)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    eps_sq = eps * eps
+    grid = {}
+    for i, (px, py) in enumerate(points):
+        cell_x, cell_y = int(px // eps), int(py // eps)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in grid.get((cell_x + dx, cell_y + dy), ()):
+                    qx, qy = points[j]
+                    if (px - qx) ** 2 + (py - qy) ** 2 <= eps_sq:
+                        root_i, root_j = find(i), find(j)
+                        if root_i != root_j:
+                            parent[max(root_i, root_j)] = min(root_i, root_j)
+        grid.setdefault((cell_x, cell_y), []).append(i)
+    
+    labels = {}
+    return np.array([labels.setdefault(find(i), len(labels)) for i in range(len(points))], dtype=int)
+
+
+def group_marks(colored_points, offset=(0, 0), eps=None, max_marks=4):
+    """
+    Cluster nearby detections and return up to max_marks mark centers,
+    keeping the largest clusters and sorting them by position.
+    """
+    if len(colored_points) == 0:
+        return []
+    if eps is None:
+        eps = MARK_CLUSTER_EPS
+    
+    mx, my = offset
+    colored_array = np.array(colored_points)
+    with profiler.span('clustering'):
+        labels = cluster_points(colored_points, eps)
+    
+    # Calculate centroid of each cluster
+    cluster_sizes = []
+    for label in range(labels.max() + 1):
+        members = colored_array[labels == label]
+        centroid = members.mean(axis=0)
+        cluster_sizes.append((len(members), int(centroid[0]) + mx, int(centroid[1]) + my))
+    
+    # Limit to maximum 4 marks
+    if len(cluster_sizes) > max_marks:
+        cluster_sizes.sort(reverse=True)
+        colored_centers = [(pos[1], pos[2]) for pos in cluster_sizes[:max_marks]]
+    else:
+        colored_centers = [(pos[1], pos[2]) for pos in cluster_sizes]
+    
+    # Sort marks by position
+    colored_centers.sort(key=lambda p: (p[1], p[0]))
+    
+    return colored_centers
+
+
+def detect_colored_marks(game_bounds, mine_area, color_name, min_area=150, frame=None):
+    """
+    Generic function to detect colored marks (red or green) within the mine area only.
+    """
+    if frame is None:
+        frame = capture_frame(mine_area)
+    
+    # Crop to mine area only
+    mine_region = frame.crop(mine_area)
+    color = f'{color_name}_mark'
+    
+    if DETECTION_SCALE > 1:
+        # Full resolution only around the coarse candidates; there is no full-size mask
+        colored_points = []
+        for window in coarse_candidates(mine_region, color, min_area, MARK_KERNEL, DETECTION_SCALE):
+            sub = mine_region.crop(window)
+            points, _ = find_mark_points(sub.labels, color, min_area)
+            colored_points += [(px + sub.origin[0], py + sub.origin[1]) for px, py in points]
+        return group_marks(colored_points), None
+    
+    colored_points, mask = find_mark_points(mine_region.labels, color, min_area)
+    
+    return group_marks(colored_points, mine_region.origin), mask
+
+
+def detect_red_marks(game_bounds, mine_area, frame=None):
+    """
+    Detects red X marks (mines to avoid) in the mine area only.
+    """
+    return detect_colored_marks(game_bounds, mine_area, "red", min_area=MARK_MIN_AREA['red'], frame=frame)
+
+
+def detect_green_marks(game_bounds, mine_area, frame=None):
+    """
+    Detects green checkmarks (successful attacks) in the mine area only.
+    """
+    return detect_colored_marks(game_bounds, mine_area, "green", min_area=MARK_MIN_AREA['green'], frame=frame)
+
+
+def roi_signature(frame, scale=8):
+    """
+    Downsampled color thumbnail of a frame, cheap to compare between polls.
+    Color is kept because buttons can have almost the same brightness as the background.
+    """
+    height, width = frame.bgr.shape[:2]
+    size = (max(width // scale, 1), max(height // scale, 1))
+    return cv2.resize(frame.bgr, size, dst=buffer_pool.take((size[1], size[0], 3)), interpolation=cv2.INTER_AREA)
+
+
+def region_changed(signature, reference, pixel_threshold=12, min_fraction=0.001):
+    """
+    Compare two signatures: changed if enough thumbnail pixels differ noticeably.
+    Counting pixels (rather than averaging) keeps small buttons from being lost in large regions.
+    """
+    if reference is None or signature.shape != reference.shape:
+        return True
+    diff = cv2.absdiff(signature, reference, dst=buffer_pool.take(signature.shape)).max(axis=2)
+    changed = np.count_nonzero(diff > pixel_threshold)
+    return changed >= max(1, int(diff.size * min_fraction))
+
+
+def wait_for_state(region, check, timeout, baseline=None):
+    """
+    Watch a screen region and return the first truthy result of check(frame).
+    The check only runs when the region differs from what it last saw (plus once
+    every WAIT_MAX_QUIET seconds), so unchanged polls cost one small capture.
+    If baseline (a signature taken before an action) is given, nothing is
+    accepted until the region has changed from it.
+    Returns None when the deadline passes.
+    """
+    deadline = clock.time() + timeout
+    reference = None
+    last_check = 0.0
+    changed_from_baseline = baseline is None
+    
+    while True:
+        frame = capture_frame(region)
+        signature = roi_signature(frame)
+        
+        if not changed_from_baseline:
+            changed_from_baseline = region_changed(signature, baseline)
+        
+        now = clock.time()
+        if changed_from_baseline and (region_changed(signature, reference) or now - last_check >= WAIT_MAX_QUIET):
+            result = check(frame)
+            if result:
+                return result
+            reference = signature
+            last_check = now
+        
+        if now >= deadline:
+            return None
+        
+        sleep(WAIT_POLL_INTERVAL)
+
+
+def wait_for_button(button_color, timeout=None, search_area=None, cached=False):
+    """
+    Wait for a button to appear, checking whenever the search area changes.
+    With cached=True the last known button position is checked first.
+    """
+    if timeout is None:
+        timeout = wait_timeouts['button']
+    
+    find = find_button_cached if cached else find_button
+    with profiler.span(f'wait_for_button:{button_color}', 'wait'):
+        return wait_for_state(search_area, lambda frame: find(button_color, search_area, frame), timeout)
+
+
+def wait_for_button_gone(button_color, timeout=None, search_area=None):
+    """
+    Wait until a button is no longer visible (e.g. the dialog has closed).
+    """
+    if timeout is None:
+        timeout = wait_timeouts['button']
+    
+    with profiler.span(f'wait_for_button_gone:{button_color}', 'wait'):
+        return wait_for_state(search_area, lambda frame: find_button(button_color, search_area, frame) is None, timeout)
+
+
+def find_button(button_color='red', search_area=None, frame=None):
+    """
+    Find a button on screen by color.
+    """
+    if frame is None:
+        frame = capture_frame(search_area)
+    
+    # Crop to search area if provided
+    if search_area:
+        frame = frame.crop(search_area)
+    
+    if button_color not in BUTTON_MIN_AREA:
+        return None
+    
+    color = f'{button_color}_button'
+    min_area = BUTTON_MIN_AREA[button_color]
+    
+    # With coarse-to-fine detection only the windows around candidates are checked
+    windows = [frame]
+    if DETECTION_SCALE > 1:
+        windows = [frame.crop(window) for window in coarse_candidates(frame, color, min_area, BUTTON_KERNEL, DETECTION_SCALE)]
+    
+    best = None
+    for window in windows:
+        mask = color_mask(window.labels, color)
+        
+        # Clean up
+        with profiler.span('morphology'):
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, BUTTON_KERNEL, dst=buffer_pool.take(mask.shape))
+        
+        # Find the largest region
+        areas, centroids = find_blobs(mask, min_area)
+        if len(areas) == 0:
+            continue
+        
+        largest = areas.argmax()
+        if best is None or areas[largest] > best[0]:
+            cx, cy = centroids[largest].astype(int)
+            best = (areas[largest], int(cx) + window.origin[0], int(cy) + window.origin[1])
+    
+    if best is None:
+        return None
+    return (best[1], best[2])
+
+
+def button_roi(position):
+    """
+    Small rectangle around a cached button position.
+    """
+    w, h = BUTTON_ROI_SIZE
+    return (position[0] - w // 2, position[1] - h // 2, w, h)
+
+
+def find_button_cached(button_color, search_area=None, frame=None):
+    """
+    Check the button's learned template first, then look for it by color around
+    its cached position, and only search the whole area on a miss. Positions
+    are cached per window bounds, with the patch confirm_button() may learn.
+    """
+    if frame is None:
+        frame = capture_frame(search_area)
+    
+    # A learned template at its usual spot needs no segmentation at all
+    button = match_button_template(button_color, frame)
+    if button:
+        button_cache[button_color] = {'position': button, 'bounds': window_cache['bounds'], 'patch': None}
+        return button
+    
+    cached = button_cache.get(button_color)
+    if cached and cached['bounds'] == window_cache['bounds']:
+        button = find_button(button_color, button_roi(cached['position']), frame)
+        if button:
+            cached['position'] = button
+            cached['patch'] = button_patch(frame, button)
+            return button
+    
+    button = find_button(button_color, search_area, frame)
+    if button:
+        button_cache[button_color] = {'position': button, 'bounds': window_cache['bounds'],
+                                      'patch': button_patch(frame, button)}
+    return button
+
+
+def button_patch(frame, position):
+    """
+    Copy of the patch compared by match_button_template() around a screen
+    position, or None if the frame does not cover all of it.
+    """
+    roi_w, roi_h = BUTTON_ROI_SIZE
+    w, h = max(roi_w // 5, 8), max(roi_h // 5, 8)
+    patch = frame.crop((position[0] - w // 2, position[1] - h // 2, w, h)).bgr
+    if patch.shape[:2] != (h, w):
+        return None
+    return patch.copy()
+
+
+def window_size_key(bounds):
+    return f"{bounds[2]}x{bounds[3]}"
+
+
+def match_button_template(button_color, frame):
+    """
+    Compare the frame at the button's learned position with its learned look.
+    Returns the button's screen position on a hit, otherwise None.
+    """
+    bounds = window_cache['bounds']
+    if bounds is None:
+        return None
+    template = button_templates.get(window_size_key(bounds), {}).get(button_color)
+    if template is None:
+        return None
+    
+    position = (bounds[0] + template['offset'][0], bounds[1] + template['offset'][1])
+    expected = template['patch']
+    h, w = expected.shape[:2]
+    with profiler.span('button_template'):
+        patch = frame.crop((position[0] - w // 2, position[1] - h // 2, w, h)).bgr
+        if patch.shape != expected.shape:
+            return None
+        difference = cv2.norm(patch, expected, cv2.NORM_L1) / expected.size
+    return position if difference <= BUTTON_MATCH_TOLERANCE else None
+
+
+def confirm_button(button_color):
+    """
+    The last click on this button had its effect: keep the look and place it
+    was found with as the button's template for this window size.
+    """
+    cached = button_cache.get(button_color)
+    bounds = window_cache['bounds']
+    if not cached or cached.get('patch') is None or bounds is None or cached['bounds'] != bounds:
+        return
+    
+    offset = [cached['position'][0] - bounds[0], cached['position'][1] - bounds[1]]
+    templates = button_templates.setdefault(window_size_key(bounds), {})
+    known = templates.get(button_color)
+    if known is not None and list(known['offset']) == offset:
+        return
+    
+    templates[button_color] = {'offset': offset, 'patch': cached['patch']}
+    cached['patch'] = None
+    save_button_templates()
+
+
+def save_button_templates(path=None):
+    """
+    Write the learned templates, merged into what the file already holds
+    (other instances may have learned other window sizes). Reading, merging
+    and swapping in the new file happen under template_file_lock, so
+    instances cannot drop each other's templates.
+    """
+    path = path or BUTTON_TEMPLATE_FILE
+    if not path:
+        return
+    guard = template_file_lock if template_file_lock is not None else contextlib.nullcontext()
+    try:
+        with guard:
+            stored = load_button_template_file(path)
+            for key, templates in button_templates.items():
+                stored.setdefault(key, {}).update(templates)
+            
+            data = {key: {color: {'offset': list(t['offset']), 'patch': t['patch'].tolist()} for color, t in templates.items()}
+                    for key, templates in stored.items()}
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(data, f)
+            os.replace(temporary, path)
+    except (OSError, ValueError) as e:
+        print(f"✗ Could not save button templates to {path}: {e}")
+
+
+def load_button_template_file(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    return {key: {color: {'offset': t['offset'], 'patch': np.array(t['patch'], np.uint8)} for color, t in templates.items()}
+            for key, templates in data.items()}
+
+
+def load_button_templates(path=None):
+    """
+    Load templates learned in earlier sessions, if any.
+    """
+    path = path or BUTTON_TEMPLATE_FILE
+    if not path:
+        return
+    try:
+        button_templates.update(load_button_template_file(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"✗ Ignoring button templates in {path}: {e}")
+        return
+    if button_templates:
+        count = sum(len(templates) for templates in button_templates.values())
+        print(f"✓ Loaded {count} button templates from {path}")
+
+
+def input_dispatcher():
+    """
+    The dispatcher sending clicks to input_backend, started on first use and
+    replaced when the backend is swapped (simulator, worker processes).
+    """
+    global dispatcher
+    if dispatcher is None or dispatcher.backend is not input_backend:
+        if dispatcher is not None:
+            dispatcher.stop()
+        dispatcher = InputDispatcher(input_backend, now=lambda: clock.perf_counter(), sleep=sleep,
+                                     gap=CLICK_DELAY, profiler=profiler).start()
+    return dispatcher
+
+
+def stop_input_dispatcher(wait=True):
+    """
+    Stop the input thread. With wait, queued clicks go out first and a failed
+    click (e.g. PyAutoGUI's fail-safe) is raised here.
+    """
+    global dispatcher
+    if dispatcher is None:
+        return
+    current, dispatcher = dispatcher, None
+    try:
+        if wait:
+            current.drain(timeout=5)
+    finally:
+        current.stop(join=wait)
+
+
+def click_and_await(x, y, check, name):
+    """
+    Click and wait for check() to see the game react (a wait_for_* call).
+    Returns check()'s result; the reaction time is profiled as ui_latency:<name>.
+    """
+    return wait_result(input_dispatcher().click_and_await(x, y, check, name))
+
+
+def sleep(seconds):
+    """
+    clock.sleep() that shows up as a 'sleep' span in the profile.
+    """
+    with profiler.span('sleep', 'sleep'):
+        clock.sleep(seconds)
+
+
+def log_event(event, **fields):
+    """
+    Append a record to the event log, if one is open.
+    """
+    if event_log is not None and not event_log.closed:
+        event_log.write(event, **fields)
+
+
+def elapsed_ms(start):
+    """
+    Milliseconds since start, a value of clock.perf_counter().
+    """
+    return round((clock.perf_counter() - start) * 1000, 1)
+
+
+def search_for_new_mines():
+    """
+    Click the blue SEARCH button to find new mines.
+    """
+    start = clock.perf_counter()
+    latency = {}
+    
+    def finish(outcome):
+        latency['total'] = elapsed_ms(start)
+        log_event('search', outcome=outcome, latency_ms=latency)
+        return outcome == 'new_mines'
+    
+    # Get game window bounds to restrict search to bottom area
+    layout = get_game_layout(revalidate=False)
+    search_area = layout['search_area'] if layout else None
+    
+    # Look for the blue SEARCH button
+    search_button = wait_for_button('blue', search_area=search_area, cached=True)
+    latency['search_button'] = elapsed_ms(start)
+    
+    if search_button is None:
+        print("✗ ERROR: SEARCH button not found")
+        return finish('no_button')
+    
+    if layout is None:
+        print("✗ ERROR: game window not found")
+        return finish('no_window')
+    
+    # Remember how the mine area looked so the old mines are not mistaken for new ones
+    mine_area = layout['mine_area']
+    baseline = roi_signature(capture_frame(mine_area))
+    
+    # Wait for search to complete and verify new mines appeared
+    def new_mines_visible(frame):
+        red_centers, _ = detect_red_marks(layout['bounds'], mine_area, frame)
+        return len(red_centers) > 0
+    
+    def await_new_mines():
+        quiet = wait_timeouts['search_unchanged']
+        found = wait_for_state(mine_area, new_mines_visible, quiet, baseline)
+        if found:
+            return found
+        # The new set can look exactly like the old one, so stop waiting for a change
+        # and accept red mines, or keep waiting for them until the full deadline
+        return wait_for_state(mine_area, new_mines_visible, max(wait_timeouts['search_result'] - quiet, 0))
+    
+    search_x, search_y = search_button
+    clicked = clock.perf_counter()
+    found = click_and_await(search_x, search_y, await_new_mines, 'search_result')
+    latency['search_result'] = elapsed_ms(clicked)
+    if found:
+        confirm_button('blue')
+    return finish('new_mines' if found else 'none')
+
+def return_troops_from_mine(mine_position, mine_name, mine_id=None, search_area=None):
+    """
+    Return troops from a green mine.
+    search_area is the dialog area; it is looked up when not given.
+    """
+    start = clock.perf_counter()
+    latency = {}
+    
+    # Adjust position - click on the mine structure below the green mark
+    adjusted_position = adjust_mine_click_position(mine_position)
+    
+    # Get dialog area for button search
+    if search_area is None:
+        layout = get_game_layout(revalidate=False)
+        search_area = layout['dialog_area'] if layout else None
+    
+    # Click on the green mine and wait for the yellow RETURN button
+    mine_x, mine_y = adjusted_position
+    return_button = click_and_await(mine_x, mine_y, lambda: wait_for_button('yellow', search_area=search_area, cached=True),
+                                    'return_dialog')
+    latency['return_button'] = elapsed_ms(start)
+    
+    if return_button is None:
+        log_event('return', mine_id=mine_id, position=[int(v) for v in mine_position], outcome='failed', latency_ms=latency)
+        return False
+    
+    # Click it and wait for the dialog to close before the next click
+    return_x, return_y = return_button
+    if click_and_await(return_x, return_y, lambda: wait_for_button_gone('yellow', search_area=button_roi(return_button)),
+                       'return_close'):
+        confirm_button('yellow')
+    tracker.record_return(mine_id)
+    latency['total'] = elapsed_ms(start)
+    log_event('return', mine_id=mine_id, position=[int(v) for v in mine_position], outcome='returned', latency_ms=latency)
+    
+    stats['troops_returned'] += 1
+    return True
+
+
+def return_troops(green_mines):
+    """
+    Return troops from several green mines back-to-back, reusing the dialog
+    area and the cached RETURN button position. Returns how many succeeded.
+    """
+    if not green_mines:
+        return 0
+    
+    layout = get_game_layout(revalidate=False)
+    search_area = layout['dialog_area'] if layout else None
+    
+    returned = 0
+    for mine in green_mines:
+        if return_troops_from_mine(mine['position'], f"green mine #{mine['id']}", mine['id'], search_area):
+            returned += 1
+    
+    print(f"→ Returned {returned}/{len(green_mines)} troops")
+    return returned
+
+
+class MineTracker:
+    """
+    Give each mine a persistent ID across detections by nearest-neighbour
+    association, and keep per-mine state (attempts, last outcome, first seen).
+    """
+
+    def __init__(self, tolerance=MATCH_RADIUS, max_missed=3):
+        self.tolerance = tolerance
+        self.max_missed = max_missed
+        self.mines = {}
+        self.next_id = 1
+
+    def reset(self):
+        """
+        Forget all mines, e.g. after a search brings up a new set.
+        """
+        self.mines = {}
+
+    def update(self, results):
+        """
+        Associate detected mines with tracked ones and add a 'mine_id' to each result.
+        Closest pairs are matched first; unmatched detections become new mines.
+        """
+        now = clock.time()
+        detections = [(mine, 'red') for mine in results['red_mines']] + [(mine, 'green') for mine in results['green_mines']]
+        
+        pairs = []
+        for d, (mine, _) in enumerate(detections):
+            px, py = mine['position']
+            for mine_id, tracked in self.mines.items():
+                tx, ty = tracked['position']
+                distance = (tx - px) ** 2 + (ty - py) ** 2
+                if distance <= self.tolerance ** 2:
+                    pairs.append((distance, d, mine_id))
+        pairs.sort()
+        
+        assigned = {}
+        used_ids = set()
+        for _, d, mine_id in pairs:
+            if d not in assigned and mine_id not in used_ids:
+                assigned[d] = mine_id
+                used_ids.add(mine_id)
+        
+        for d, (mine, color) in enumerate(detections):
+            mine_id = assigned.get(d)
+            if mine_id is None:
+                mine_id = self.next_id
+                self.next_id += 1
+                self.mines[mine_id] = {
+                    'id': mine_id,
+                    'attempts': 0,
+                    'last_outcome': None,
+                    'first_seen': now
+                }
+                used_ids.add(mine_id)
+            if color == 'green' and self.mines[mine_id].get('color') == 'returned':
+                # Troops already recalled; the check mark can linger for a moment
+                color = 'returned'
+            self.mines[mine_id].update({
+                'position': mine['position'],
+                'color': color,
+                'last_seen': now,
+                'missed': 0
+            })
+            mine['mine_id'] = mine_id
+        
+        # Drop mines that have not been seen for a while
+        for mine_id in list(self.mines):
+            if mine_id not in used_ids:
+                self.mines[mine_id]['missed'] += 1
+                if self.mines[mine_id]['missed'] > self.max_missed:
+                    del self.mines[mine_id]
+        
+        return results
+
+    def record_attempt(self, mine_id):
+        if mine_id in self.mines:
+            self.mines[mine_id]['attempts'] += 1
+
+    def record_outcome(self, mine_id, outcome, position=None):
+        if mine_id in self.mines:
+            self.mines[mine_id]['last_outcome'] = outcome
+            if outcome == 'success':
+                self.mines[mine_id]['color'] = 'green'
+            if position is not None:
+                self.mines[mine_id]['position'] = position
+
+    def record_return(self, mine_id):
+        if mine_id in self.mines:
+            self.mines[mine_id]['color'] = 'returned'
+
+    def visible(self, color):
+        """
+        Tracked mines of a color that were present in the latest detection.
+        """
+        return [m for m in self.mines.values() if m['color'] == color and m['missed'] == 0]
+
+    def failed(self, mine_id):
+        return mine_id in self.mines and self.mines[mine_id]['last_outcome'] == 'failed'
+
+
+# Mines seen in the current batch, keyed by persistent ID
+tracker = MineTracker()
+
+
+def attack_mine(mine_position, mine_name, mine_id=None):
+    """
+    Attack a red mine at the given position.
+    The attempt and its outcome are recorded on the tracked mine when mine_id is given.
+    Returns the outcome as stored in the statistics database: 'success' or
+    'failed' for a battle, 'no_attack_button', 'no_depart_button' or
+    'dialog_open' when it never got that far.
+    """
+    stats['total_attacks'] += 1
+    tracker.record_attempt(mine_id)
+    start = clock.perf_counter()
+    
+    def finish(outcome, reason='', position=None):
+        success = outcome == 'success'
+        if success:
+            print(f"✓ {mine_name}: SUCCESS")
+            stats['successful_attacks'] += 1
+        else:
+            print(f"✗ {mine_name}: FAILED{reason}")
+            stats['failed_attacks'] += 1
+        tracker.record_outcome(mine_id, 'success' if success else 'failed', position)
+        return outcome
+    
+    def log_step(event, outcome, step, step_start, **fields):
+        latency = {step: elapsed_ms(step_start), 'attack_total': elapsed_ms(start)}
+        log_event(event, mine_id=mine_id, position=[int(v) for v in mine_position], location=window_location(mine_position),
+                  outcome=outcome, latency_ms=latency, **fields)
+    
+    # Adjust position - click on the mine structure below the red X mark
+    adjusted_position = adjust_mine_click_position(mine_position)
+    
+    # Get dialog area for button search
+    layout = get_game_layout(revalidate=False)
+    search_area = layout['dialog_area'] if layout else None
+    
+    # Click on the mine and wait for the red ATTACK button
+    mine_x, mine_y = adjusted_position
+    attack_button = click_and_await(mine_x, mine_y, lambda: wait_for_button('red', search_area=search_area, cached=True),
+                                    'attack_dialog')
+    log_step('attack', 'clicked' if attack_button else 'no_button', 'attack_button', start, name=mine_name)
+    
+    if attack_button is None:
+        return finish('no_attack_button', " (ATTACK button not found)")
+    
+    # Click it and wait for the green DEPART button
+    attack_x, attack_y = attack_button
+    step_start = clock.perf_counter()
+    depart_button = click_and_await(attack_x, attack_y, lambda: wait_for_button('green', search_area=search_area, cached=True),
+                                    'depart_dialog')
+    log_step('depart', 'clicked' if depart_button else 'no_button', 'depart_button', step_start)
+    
+    if depart_button is None:
+        return finish('no_depart_button', " (DEPART button not found)")
+    confirm_button('red')
+    
+    # Click it and check if the mine turned green (successful) or stayed red (failed)
+    depart_x, depart_y = depart_button
+    step_start = clock.perf_counter()
+    dialog_closed = []
+    
+    def await_result():
+        deadline = clock.time() + wait_timeouts['attack_result']
+        # The DEPART button is green as well; until it is gone a mine under it would read as won
+        if not wait_for_button_gone('green', wait_timeouts['attack_result'], search_area):
+            return None
+        dialog_closed.append(True)
+        return verify_attack_result(mine_position, max(deadline - clock.time(), 0))
+    
+    green_position = click_and_await(depart_x, depart_y, await_result, 'attack_result')
+    if not dialog_closed:
+        log_step('verification', 'dialog_open', 'verification', step_start)
+        return finish('dialog_open', " (DEPART dialog did not close)")
+    log_step('verification', 'success' if green_position else 'failed', 'verification', step_start)
+    if green_position is not None:
+        confirm_button('green')
+    return finish('success' if green_position is not None else 'failed', position=green_position)
+
+
+def verify_attack_result(mine_position, timeout=None):
+    """
+    Watch only the patch around an attacked mine until its mark turns green.
+    Returns the green mark's position, or None if it did not flip before the timeout.
+    """
+    if timeout is None:
+        timeout = wait_timeouts['attack_result']
+    
+    x, y = mine_position
+    r = MATCH_RADIUS
+    patch = (x - r, y - r, 2 * r, 2 * r)
+    
+    def green_at_mine(frame):
+        state, position = classify_slot_patch(frame, mine_position, r)
+        return position if state == 'green' else None
+    
+    return wait_for_state(patch, green_at_mine, timeout)
+
+
+def classify_mines(centers, prefix, slots=None):
+    """
+    Label mines as prefix1, prefix2, ... in sort order, or by slot number
+    (prefix<slot+1>) when slot indexes are known, so names stay stable.
+    """
+    if len(centers) == 0:
+        return []
+    
+    results = []
+    for i, pos in enumerate(centers, 1):
+        slot = slots[i - 1] if slots else None
+        results.append({
+            'position_name': f'{prefix}{i if slot is None else slot + 1}',
+            'position': pos,
+            'slot': slot
+        })
+    
+    return results
+
+
+def slot_centers(game_bounds):
+    """
+    Convert learned slot positions to screen coordinates for the given window.
+    """
+    x, y, w, h = game_bounds
+    return [(x + int(fx * w), y + int(fy * h)) for fx, fy in mine_slots['positions']]
+
+
+def window_location(position):
+    """
+    Screen position as (fx, fy) fractions of the game window, or None if the window is unknown.
+    """
+    bounds = window_cache['bounds']
+    if bounds is None:
+        return None
+    x, y, w, h = bounds
+    return [round((position[0] - x) / w, 3), round((position[1] - y) / h, 3)]
+
+
+def nearest_slot(position, centers, max_distance=None):
+    """
+    Index of the slot center closest to position, or None if none is close enough.
+    """
+    if max_distance is None:
+        max_distance = SLOT_PATCH_RADIUS
+    best, best_distance = None, max_distance ** 2
+    for index, (sx, sy) in enumerate(centers):
+        distance = (sx - position[0]) ** 2 + (sy - position[1]) ** 2
+        if distance <= best_distance:
+            best, best_distance = index, distance
+    return best
+
+
+def learn_mine_slots(game_bounds, centers):
+    """
+    Record mark centers from a full detection and, once enough detections agree
+    on at most SLOT_MAX positions, store them as the slot layout.
+    """
+    x, y, w, h = game_bounds
+    observations = mine_slots['observations']
+    observations.append([((cx - x) / w, (cy - y) / h) for cx, cy in centers])
+    del observations[:-SLOT_LEARN_DETECTIONS]
+    
+    if len(observations) < SLOT_LEARN_DETECTIONS:
+        return
+    
+    points = [(fx * w, fy * h) for frame_points in observations for fx, fy in frame_points]
+    if not points:
+        return
+    
+    labels = cluster_points(points, SLOT_PATCH_RADIUS)
+    if labels.max() + 1 > SLOT_MAX:
+        mine_slots['positions'] = []
+        return
+    
+    points = np.array(points)
+    positions = []
+    for label in range(labels.max() + 1):
+        px, py = points[labels == label].mean(axis=0)
+        positions.append((float(px / w), float(py / h)))
+    
+    # Same order as full detection: top to bottom, left to right
+    mine_slots['positions'] = sorted(positions, key=lambda p: (p[1], p[0]))
+
+
+def classify_slot_patch(frame, center, r=None):
+    """
+    Classify one slot from a small patch: 'red', 'green', 'empty', or None if
+    the patch is ambiguous. Returns (state, mark_center).
+    """
+    if r is None:
+        r = SLOT_PATCH_RADIUS
+    cx, cy = center
+    patch = frame.crop((cx - r, cy - r, 2 * r, 2 * r))
+    
+    found = []
+    for color in ('red', 'green'):
+        mask = color_mask(patch.labels, f'{color}_mark')
+        count = cv2.countNonZero(mask)
+        if count > MARK_MIN_AREA[color]:
+            found.append((color, mask))
+        elif count > MARK_MIN_AREA[color] * 0.25:
+            # Partially visible mark, let the full detection decide
+            return None, None
+    
+    if len(found) > 1:
+        return None, None
+    if not found:
+        return 'empty', None
+    
+    color, mask = found[0]
+    rows, cols = np.nonzero(mask)
+    ox, oy = patch.origin
+    return color, (int(cols.mean()) + ox, int(rows.mean()) + oy)
+
+
+def marks_outside_slots(frame, mine_area, centers):
+    """
+    Cheap layout check: look for red/green pixels in a subsampled copy of the
+    mine area, ignoring the slot patches. Marks there mean the layout changed.
+    """
+    stride = SLOT_CHECK_STRIDE
+    mine_region = frame.crop(mine_area)
+    subsampled = mine_region.bgr[::stride, ::stride]
+    small = buffer_pool.take(subsampled.shape)
+    np.copyto(small, subsampled)
+    labels = classify_pixels(cv2.cvtColor(small, cv2.COLOR_BGR2HSV, dst=buffer_pool.take(small.shape)))
+    mask = cv2.bitwise_or(color_mask(labels, 'red_mark'), color_mask(labels, 'green_mark'), dst=buffer_pool.take(labels.shape))
+    
+    ox, oy = mine_region.origin
+    r = SLOT_PATCH_RADIUS
+    for cx, cy in centers:
+        left, top = max((cx - r - ox) // stride, 0), max((cy - r - oy) // stride, 0)
+        mask[top:(cy + r - oy) // stride + 1, left:(cx + r - ox) // stride + 1] = 0
+    
+    return cv2.countNonZero(mask) * stride * stride > min(MARK_MIN_AREA.values())
+
+
+def detect_mines_by_slots(frame, layout):
+    """
+    Classify each learned slot from its own patch instead of segmenting the
+    whole mine area. Returns None when the layout check fails.
+    """
+    centers = slot_centers(layout['bounds'])
+    if marks_outside_slots(frame, layout['mine_area'], centers):
+        return None
+    
+    red, green = [], []
+    for slot, center in enumerate(centers):
+        state, position = classify_slot_patch(frame, center)
+        if state is None:
+            return None
+        if state == 'red':
+            red.append((position, slot))
+        elif state == 'green':
+            green.append((position, slot))
+    
+    return {
+        'red_mines': classify_mines([p for p, _ in red], 'red_mine', [s for _, s in red]),
+        'green_mines': classify_mines([p for p, _ in green], 'green_mine', [s for _, s in green])
+    }
+
+
+def detect_mines(frame=None):
     """
-    Generic function to detect colored marks (red or green) within the mine area only.
+    Detect all red and green mines from a single capture.
+    Uses the learned slot layout when available and falls back to segmenting
+    the whole mine area otherwise.
     """
-    screenshot = pyautogui.screenshot()
-    screenshot_np = np.array(screenshot)
-    screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-    
-    # Crop to mine area only
-    mx, my, mw, mh = mine_area
-    mine_region = screenshot_cv[my:my+mh, mx:mx+mw]
-    
-    # Convert to HSV
-    hsv = cv2.cvtColor(mine_region, cv2.COLOR_BGR2HSV)
+    if frame is None:
+        frame = capture_frame(window_cache['bounds'])
     
-    # Color detection
-    mask1 = cv2.inRange(hsv, lower_hsv1, upper_hsv1)
-    
-    if lower_hsv2 is not None and upper_hsv2 is not None:
-        mask2 = cv2.inRange(hsv, lower_hsv2, upper_hsv2)
-        color_mask = cv2.bitwise_or(mask1, mask2)
-    else:
-        color_mask = mask1
-    
-    # Clean up the mask
-    kernel = np.ones((5,5), np.uint8)
-    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_CLOSE, kernel)
-    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, kernel)
-    
-    # Find contours
-    contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Get all colored region centers
-    colored_points = []
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > min_area:
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-                colored_points.append((cx, cy))
+    layout = get_game_layout(frame)
     
-    if len(colored_points) == 0:
-        return [], color_mask
+    if layout is None:
+        return None
     
-    # Cluster nearby detections
-    colored_array = np.array(colored_points)
-    clustering = DBSCAN(eps=45, min_samples=1).fit(colored_array)
+    game_bounds = layout['bounds']
+    mine_area = layout['mine_area']
     
-    # Calculate centroid of each cluster
-    cluster_sizes = []
-    for label in set(clustering.labels_):
-        cluster_points = colored_array[clustering.labels_ == label]
-        centroid = cluster_points.mean(axis=0)
-        cluster_sizes.append((len(cluster_points), int(centroid[0]) + mx, int(centroid[1]) + my))
+    if not frame_covers(frame, game_bounds):
+        # The window moved out of the captured region; capture it where it is now
+        frame = capture_frame(game_bounds)
     
-    # Limit to maximum 4 marks
-    if len(cluster_sizes) > 4:
-        cluster_sizes.sort(reverse=True)
-        colored_centers = [(pos[1], pos[2]) for pos in cluster_sizes[:4]]
-    else:
-        colored_centers = [(pos[1], pos[2]) for pos in cluster_sizes]
+    if mine_slots['positions']:
+        results = detect_mines_by_slots(frame, layout)
+        if results is not None:
+            return results
     
-    # Sort marks by position
-    colored_centers.sort(key=lambda p: (p[1], p[0]))
+    # Detect red and green marks
+    red_centers, _ = detect_red_marks(game_bounds, mine_area, frame)
+    green_centers, _ = detect_green_marks(game_bounds, mine_area, frame)
+    
+    # Keep slot names if every mark still sits in a known slot, otherwise relearn
+    centers = slot_centers(game_bounds)
+    red_slots = [nearest_slot(p, centers) for p in red_centers]
+    green_slots = [nearest_slot(p, centers) for p in green_centers]
+    if centers and None in red_slots + green_slots:
+        mine_slots['positions'] = []
+        mine_slots['observations'] = []
+    learn_mine_slots(game_bounds, red_centers + green_centers)
+    
+    slots_known = bool(centers) and None not in red_slots + green_slots
+    red_results = classify_mines(red_centers, 'red_mine', red_slots if slots_known else None)
+    green_results = classify_mines(green_centers, 'green_mine', green_slots if slots_known else None)
     
-    return colored_centers, color_mask
+    return {
+        'red_mines': red_results,
+        'green_mines': green_results
+    }
 
 
-def detect_red_marks(game_bounds, mine_area):
+CALIBRATION_FILE = 'calibration.json'
+CALIBRATION_MIN_PIXELS = 200   # Measured pixels a color needs before its range is replaced
+CALIBRATION_SEED_MARGIN = (5, 40, 40)   # H, S, V widening of the default ranges when looking for colors
+CALIBRATION_MARGIN = (2, 15, 15)        # H, S, V margin around the measured 1st-99th percentiles
+
+# Profile in use (None = defaults), kept for checkpoints
+calibration_profile = None
+
+# Values as shipped, the base every calibration starts from
+DEFAULT_COLOR_RANGES = copy.deepcopy(COLOR_RANGES)
+PIXEL_DEFAULTS = {
+    'mark_min_area': dict(MARK_MIN_AREA),
+    'button_min_area': dict(BUTTON_MIN_AREA),
+    'mark_kernel': MARK_KERNEL.shape[0],
+    'button_kernel': BUTTON_KERNEL.shape[0],
+    'button_roi_size': list(BUTTON_ROI_SIZE),
+    'slot_patch_radius': SLOT_PATCH_RADIUS,
+    'match_radius': MATCH_RADIUS,
+    'mark_cluster_eps': MARK_CLUSTER_EPS,
+    'mine_click_offset': MINE_CLICK_OFFSET
+}
+
+
+def scaled_pixel_constants(scale):
     """
-    Detects red X marks (mines to avoid) in the mine area only.
+    The default pixel constants for a window scale times the reference size.
+    Lengths scale linearly, areas with the square, kernels stay odd.
     """
-    lower_red1 = np.array([0, 120, 120])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([170, 120, 120])
-    upper_red2 = np.array([180, 255, 255])
-    
-    return detect_colored_marks(game_bounds, mine_area, "red", lower_red1, upper_red1, lower_red2, upper_red2)
+    d = PIXEL_DEFAULTS
+    length = lambda v: int(round(v * scale))
+    kernel = lambda v: max(3, int(round(v * scale)) | 1)
+    return {
+        'mark_min_area': {color: int(round(a * scale * scale)) for color, a in d['mark_min_area'].items()},
+        'button_min_area': {color: int(round(a * scale * scale)) for color, a in d['button_min_area'].items()},
+        'mark_kernel': kernel(d['mark_kernel']),
+        'button_kernel': kernel(d['button_kernel']),
+        'button_roi_size': [length(v) for v in d['button_roi_size']],
+        'slot_patch_radius': length(d['slot_patch_radius']),
+        'match_radius': length(d['match_radius']),
+        'mark_cluster_eps': length(d['mark_cluster_eps']),
+        'mine_click_offset': length(d['mine_click_offset'])
+    }
 
 
-def detect_green_marks(game_bounds, mine_area):
+def widen_ranges(boxes, margin):
     """
-    Detects green checkmarks (successful attacks) in the mine area only.
+    HSV boxes grown by margin (H, S, V) on both sides, clipped to OpenCV's ranges.
     """
-    lower_green = np.array([35, 60, 60])
-    upper_green = np.array([85, 255, 255])
-    
-    return detect_colored_marks(game_bounds, mine_area, "green", lower_green, upper_green, min_area=100)
+    limits = (180, 255, 255)
+    return [(tuple(max(lo - m, 0) for lo, m in zip(lower, margin)),
+             tuple(min(hi + m, top) for hi, m, top in zip(upper, margin, limits)))
+            for lower, upper in boxes]
 
 
-def wait_for_button(button_color, timeout=2.5, search_area=None):
+def measure_color_range(pixels, wraps=False, margin=CALIBRATION_MARGIN):
     """
-    Wait for a button to appear, checking repeatedly until timeout.
+    HSV boxes covering the 1st-99th percentile of measured (N, 3) HSV pixels plus margin.
+    Red hue wraps around 180, so it is measured shifted by 90 and split back into two boxes.
     """
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        button = find_button(button_color, search_area)
-        
-        if button:
-            return button
-        
-        time.sleep(0.1)  # Wait 100ms before retry
-    
-    return None
+    hue = pixels[:, 0].astype(int)
+    if wraps:
+        hue = (hue + 90) % 180
+    columns = [hue, pixels[:, 1].astype(int), pixels[:, 2].astype(int)]
+    lower = [int(np.percentile(c, 1)) - m for c, m in zip(columns, margin)]
+    upper = [int(np.percentile(c, 99)) + m for c, m in zip(columns, margin)]
+    sat_val = ((max(lower[1], 0), max(lower[2], 0)), (min(upper[1], 255), min(upper[2], 255)))
+    
+    def box(h_low, h_high):
+        return ((h_low, sat_val[0][0], sat_val[0][1]), (h_high, sat_val[1][0], sat_val[1][1]))
+    
+    if not wraps:
+        return [box(max(lower[0], 0), min(upper[0], 180))]
+    
+    h_low, h_high = lower[0] - 90, upper[0] - 90
+    if h_low < 0 <= h_high:
+        return [box(0, h_high), box(180 + h_low, 180)]
+    if h_high < 0:
+        return [box(180 + h_low, 180 + h_high)]
+    return [box(h_low, h_high)]
 
 
-def find_button(button_color='red', search_area=None):
+def collect_blob_pixels(hsv, mask, min_area, max_area=None, kernel=None):
     """
-    Find a button on screen by color.
+    HSV pixels of the mask that belong to blobs between min_area and max_area
+    (measured after an optional closing with kernel).
     """
-    screenshot = pyautogui.screenshot()
-    screenshot_np = np.array(screenshot)
-    screenshot_cv = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-    
-    # Crop to search area if provided
-    if search_area:
-        x, y, w, h = search_area
-        screenshot_cv = screenshot_cv[y:y+h, x:x+w]
-        offset_x, offset_y = x, y
-    else:
-        offset_x, offset_y = 0, 0
-    
-    # Convert to HSV
-    hsv = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2HSV)
-    
-    if button_color == 'red':
-        lower_red1 = np.array([0, 100, 100])
-        upper_red1 = np.array([10, 255, 255])
-        lower_red2 = np.array([170, 100, 100])
-        upper_red2 = np.array([180, 255, 255])
-        
-        mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-        mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        mask = cv2.bitwise_or(mask1, mask2)
-        min_area = 1000
-    elif button_color == 'green':
-        lower_green = np.array([40, 80, 80])
-        upper_green = np.array([80, 255, 255])
-        mask = cv2.inRange(hsv, lower_green, upper_green)
-        min_area = 1000
-    elif button_color == 'yellow':
-        lower_yellow = np.array([20, 100, 100])
-        upper_yellow = np.array([35, 255, 255])
-        mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-        min_area = 1000
-    elif button_color == 'blue':
-        lower_blue = np.array([95, 120, 150])
-        upper_blue = np.array([115, 255, 255])
-        mask = cv2.inRange(hsv, lower_blue, upper_blue)
-        min_area = 3000
-    else:
-        return None
-    
-    # Clean up
-    kernel = np.ones((7,7), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    cleaned = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel) if kernel is not None else mask
+    count, components, blob_stats, _ = cv2.connectedComponentsWithStats(cleaned, connectivity=8)
+    areas = blob_stats[:, cv2.CC_STAT_AREA]
+    keep = (areas > min_area) & (areas < (max_area or np.inf))
+    keep[0] = False  # Background
+    selected = keep[components] & (mask > 0)
+    return hsv[selected], areas[keep].tolist()
+
+
+def calibrate(frames, reference_height=None):
+    """
+    Measure window size and color ranges from full-screen Frames of the
+    advanced mithril screen and return a calibration profile. Colors that do
+    not show up in enough pixels (e.g. dialog buttons never opened) keep their
+    default range.
+
+    The pixel constants are scaled by the window height over reference_height,
+    the height of a window they are known to work with. Without it the
+    measured window is taken as that reference: only the colors are
+    calibrated, and the profile's reference_height can be passed when
+    calibrating another screen.
+    """
+    seed_ranges = {color: widen_ranges(boxes, CALIBRATION_SEED_MARGIN) for color, boxes in DEFAULT_COLOR_RANGES.items()}
+    seed_lut, _ = build_color_lut(seed_ranges)
     
-    # Find contours
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    windows = []
+    pixels = {color: [] for color in DEFAULT_COLOR_RANGES}
+    mark_areas = {'red': [], 'green': []}
     
-    if not contours:
+    for frame in frames:
+        hsv = frame.hsv
+        labels = classify_pixels(hsv, seed_lut)
+        ox, oy = frame.origin
+        
+        # Window: the largest tan region
+        tan = color_mask(labels, 'tan')
+        count, components, blob_stats, _ = cv2.connectedComponentsWithStats(tan, connectivity=8)
+        if count < 2:
+            continue
+        largest = 1 + int(blob_stats[1:, cv2.CC_STAT_AREA].argmax())
+        x, y, w, h = (int(v) for v in blob_stats[largest, :4])
+        windows.append((x + ox, y + oy, w, h))
+        pixels['tan'].append(hsv[components == largest][::16])
+        
+        # Everything else is measured with constants scaled to this window
+        constants = scaled_pixel_constants(h / reference_height if reference_height else 1.0)
+        kernel = np.ones((constants['mark_kernel'],) * 2, np.uint8)
+        bounds = (x + ox, y + oy, w, h)
+        
+        def region(area):
+            ax, ay, aw, ah = area
+            return slice(max(ay - oy, 0), max(ay - oy + ah, 0)), slice(max(ax - ox, 0), max(ax - ox + aw, 0))
+        
+        rows, cols = region(get_mine_area(bounds))
+        for color in ('red', 'green'):
+            mark_pixels, areas = collect_blob_pixels(
+                hsv[rows, cols], color_mask(labels[rows, cols], f'{color}_mark'),
+                constants['mark_min_area'][color] * 0.5, constants['button_min_area'][color], kernel)
+            pixels[f'{color}_mark'].append(mark_pixels)
+            mark_areas[color].extend(areas)
+        
+        kernel = np.ones((constants['button_kernel'],) * 2, np.uint8)
+        for color in ('red', 'green', 'yellow', 'blue'):
+            area = get_search_area(bounds) if color == 'blue' else get_dialog_area(bounds)
+            rows, cols = region(area)
+            # Between the marks' size and large background areas of a similar color
+            min_area = constants['button_min_area'][color]
+            button_pixels, _ = collect_blob_pixels(
+                hsv[rows, cols], color_mask(labels[rows, cols], f'{color}_button'), min_area, min_area * 20, kernel)
+            pixels[f'{color}_button'].append(button_pixels)
+    
+    if not windows:
         return None
     
-    # Find the largest contour
-    largest_contour = max(contours, key=cv2.contourArea)
-    area = cv2.contourArea(largest_contour)
-    
-    if area > min_area:
-        M = cv2.moments(largest_contour)
-        if M["m00"] != 0:
-            cx = int(M["m10"] / M["m00"]) + offset_x
-            cy = int(M["m01"] / M["m00"]) + offset_y
-            return (cx, cy)
-    
-    return None
+    width = int(np.median([w for _, _, w, _ in windows]))
+    height = int(np.median([h for _, _, _, h in windows]))
+    reference = 'given' if reference_height else 'measured'
+    reference_height = reference_height or height
+    scale = height / reference_height
+    
+    color_ranges, measured = {}, {}
+    for color, chunks in pixels.items():
+        chunks = [c for c in chunks if len(c)]
+        samples = np.concatenate(chunks) if chunks else np.empty((0, 3), np.uint8)
+        measured[color] = len(samples)
+        if len(samples) >= CALIBRATION_MIN_PIXELS:
+            color_ranges[color] = measure_color_range(samples, wraps=color.startswith('red'))
+        else:
+            color_ranges[color] = DEFAULT_COLOR_RANGES[color]
+    
+    profile = {
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'frames': len(windows),
+        'window_size': [width, height],
+        # Pixel constants assume they work at reference_height; scale is relative to it
+        'reference_height': reference_height,
+        'reference': reference,
+        'scale': round(scale, 4),
+        'measured_pixels': measured,
+        'mark_area_median': {color: float(np.median(a)) if a else None for color, a in mark_areas.items()},
+        'color_ranges': {color: [[list(lower), list(upper)] for lower, upper in boxes] for color, boxes in color_ranges.items()}
+    }
+    profile.update(scaled_pixel_constants(scale))
+    return profile
 
 
-def safe_click(x, y):
+def apply_calibration(profile):
     """
-    Perform a quick click.
+    Switch the detectors to a calibration profile's color ranges and pixel constants.
     """
-    pyautogui.click(x, y)
-    time.sleep(0.15)
+    global COLOR_RANGES, color_lut, color_bits, MARK_KERNEL, BUTTON_KERNEL, BUTTON_ROI_SIZE
+    global SLOT_PATCH_RADIUS, MATCH_RADIUS, MARK_CLUSTER_EPS, MINE_CLICK_OFFSET, calibration_profile
+    
+    calibration_profile = profile
+    
+    COLOR_RANGES = copy.deepcopy(DEFAULT_COLOR_RANGES)
+    for color, boxes in profile.get('color_ranges', {}).items():
+        if color in COLOR_RANGES:
+            COLOR_RANGES[color] = [(tuple(lower), tuple(upper)) for lower, upper in boxes]
+    color_lut, color_bits = build_color_lut(COLOR_RANGES)
+    
+    MARK_MIN_AREA.update(profile['mark_min_area'])
+    BUTTON_MIN_AREA.update(profile['button_min_area'])
+    MARK_KERNEL = np.ones((profile['mark_kernel'],) * 2, np.uint8)
+    BUTTON_KERNEL = np.ones((profile['button_kernel'],) * 2, np.uint8)
+    BUTTON_ROI_SIZE = tuple(profile['button_roi_size'])
+    SLOT_PATCH_RADIUS = profile['slot_patch_radius']
+    MATCH_RADIUS = profile['match_radius']
+    MARK_CLUSTER_EPS = profile['mark_cluster_eps']
+    MINE_CLICK_OFFSET = profile['mine_click_offset']
+    tracker.tolerance = MATCH_RADIUS
+    
+    # Anything cached with the old constants is stale
+    button_cache.clear()
+    mine_slots['positions'] = []
+    mine_slots['observations'] = []
 
 
-def search_for_new_mines():
+def save_calibration(profile, path=CALIBRATION_FILE):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+
+def load_calibration(path=CALIBRATION_FILE):
     """
-    Click the blue SEARCH button to find new mines.
+    Apply a saved calibration profile if the file exists. Returns the profile or None.
     """
-    # Get game window bounds to restrict search to bottom area
-    game_bounds, _ = find_game_window()
-    if game_bounds:
-        x, y, w, h = game_bounds
-        search_area = (x, y + int(h * 0.7), w, int(h * 0.3))
-    else:
-        search_area = None
-    
-    # Look for the blue SEARCH button
-    search_button = wait_for_button('blue', timeout=2.5, search_area=search_area)
-    
-    if search_button is None:
-        print("✗ ERROR: SEARCH button not found")
-        return False
-    
-    search_x, search_y = search_button
-    safe_click(search_x, search_y)
-    
-    # Wait for search to complete
-    time.sleep(1.0)
-    
-    # Verify new mines appeared
-    results = detect_mines()
-    if results and len(results['red_mines']) > 0:
-        return True
-    else:
-        return False
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        profile = json.load(f)
+    apply_calibration(profile)
+    width, height = profile['window_size']
+    print(f"✓ Loaded calibration from {path} ({width}x{height} window, scale {profile['scale']:.2f})")
+    return profile
 
-def return_troops_from_mine(mine_position, mine_name):
+
+def calibrate_main(argv):
     """
-    Return troops from a green mine.
+    attack.py calibrate: measure a profile from live screenshots or recorded frames and save it.
     """
-    # Adjust position - click on the mine structure below the green mark
-    adjusted_position = adjust_mine_click_position(mine_position, offset_y=30)
-    
-    # Click on the green mine
-    mine_x, mine_y = adjusted_position
-    safe_click(mine_x, mine_y)
-    time.sleep(0.2)
-    
-    # Get dialog area for button search
-    game_bounds, _ = find_game_window()
-    if game_bounds:
-        x, y, w, h = game_bounds
-        dialog_x = x + int(w * 0.2)
-        dialog_y = y + int(h * 0.25)
-        dialog_w = int(w * 0.6)
-        dialog_h = int(h * 0.5)
-        search_area = (dialog_x, dialog_y, dialog_w, dialog_h)
+    parser = argparse.ArgumentParser(prog='attack.py calibrate', description='Measure color ranges and pixel sizes for this screen')
+    parser.add_argument('--frames', type=str, metavar='DIR', help='Use recorded frames (see --record) instead of the screen')
+    parser.add_argument('-c', '--count', type=int, default=5, help='Screenshots to take (default: 5)')
+    parser.add_argument('-d', '--delay', type=int, default=2, help='Countdown before the first screenshot (default: 2)')
+    parser.add_argument('--out', type=str, default=CALIBRATION_FILE, help=f'Profile file (default: {CALIBRATION_FILE})')
+    parser.add_argument('--reference-height', type=int, metavar='PX',
+                        help='Window height the shipped pixel sizes work at, e.g. reference_height from a profile '
+                             'calibrated on such a screen (default: this window, only colors are calibrated)')
+    args = parser.parse_args(argv)
+    
+    if args.frames:
+        # Recordings mix full captures with small wait regions; only the largest frames show the whole window
+        replay = ReplayCapture(args.frames)
+        loaded = [replay.load(path) for path in replay.paths]
+        largest = max(bgr.shape[0] * bgr.shape[1] for bgr, _ in loaded)
+        frames = [Frame(bgr, origin) for bgr, origin in loaded if bgr.shape[0] * bgr.shape[1] == largest]
     else:
-        search_area = None
-    
-    # Wait for and click the yellow RETURN button
-    return_button = wait_for_button('yellow', timeout=2.5, search_area=search_area)
-    
-    if return_button is None:
-        return False
-    
-    return_x, return_y = return_button
-    safe_click(return_x, return_y)
-    time.sleep(0.2)
-    
-    stats['troops_returned'] += 1
-    return True
+        print(f"Calibrating in {args.delay} seconds... Open the advanced mithril screen, ideally with red and green mines.")
+        clock.sleep(args.delay)
+        frames = []
+        for _ in range(args.count):
+            frames.append(capture_frame())
+            clock.sleep(0.5)
+    
+    profile = calibrate(frames, args.reference_height)
+    if profile is None:
+        print("✗ ERROR: game window not found in any frame")
+        sys.exit(1)
+    
+    width, height = profile['window_size']
+    print(f"✓ Game window {width}x{height} in {profile['frames']} frames, scale {profile['scale']:.2f} "
+          f"against a {profile['reference_height']} px {'reference' if profile['reference'] == 'given' else 'window (this one)'}")
+    for color, count in profile['measured_pixels'].items():
+        source = 'measured' if count >= CALIBRATION_MIN_PIXELS else 'default'
+        print(f"  {color:<14} {source:<9} {profile['color_ranges'][color]}")
+    print(f"  click offset {profile['mine_click_offset']} px, match radius {profile['match_radius']} px, "
+          f"mark areas {profile['mark_min_area']}")
+    
+    save_calibration(profile, args.out)
+    print(f"✓ Calibration saved to {args.out}")
+
+
+# Session checkpoints, see save_checkpoint(); the path is set per account by main() and run_instance()
+CHECKPOINT_INTERVAL = 30.0   # Seconds between periodic checkpoints
+checkpoint_state = {
+    'path': None,
+    'username': '',
+    'power': '',
+    'max_searches': 0,
+    'last_saved': None
+}
+
 
+def checkpoint_path(username):
+    return f"checkpoint_{username}.json"
 
-def attack_mine(mine_position, mine_name):
+
+def save_checkpoint(force=False):
     """
-    Attack a red mine at the given position.
+    Write counters, tracked mines, calibration and window layout to the
+    checkpoint file, at most every CHECKPOINT_INTERVAL seconds unless forced.
+    The file is written next to the old one and swapped in with os.replace(),
+    so a crash mid-write leaves the previous checkpoint intact.
     """
-    stats['total_attacks'] += 1
-    
-    # Adjust position - click on the mine structure below the red X mark
-    adjusted_position = adjust_mine_click_position(mine_position, offset_y=30)
-    
-    # Click on the mine
-    mine_x, mine_y = adjusted_position
-    safe_click(mine_x, mine_y)
-    time.sleep(0.2)
-    
-    # Get dialog area for button search
-    game_bounds, _ = find_game_window()
-    if game_bounds:
-        x, y, w, h = game_bounds
-        dialog_x = x + int(w * 0.2)
-        dialog_y = y + int(h * 0.25)
-        dialog_w = int(w * 0.6)
-        dialog_h = int(h * 0.5)
-        search_area = (dialog_x, dialog_y, dialog_w, dialog_h)
-    else:
-        search_area = None
-    
-    # Wait for and click the red ATTACK button
-    attack_button = wait_for_button('red', timeout=2.5, search_area=search_area)
-    
-    if attack_button is None:
-        print(f"✗ {mine_name}: FAILED (ATTACK button not found)")
-        stats['failed_attacks'] += 1
-        return False
-    
-    attack_x, attack_y = attack_button
-    safe_click(attack_x, attack_y)
-    time.sleep(0.2)
-    
-    # Wait for and click the green DEPART button
-    depart_button = wait_for_button('green', timeout=2.5, search_area=search_area)
-    
-    if depart_button is None:
-        print(f"✗ {mine_name}: FAILED (DEPART button not found)")
-        stats['failed_attacks'] += 1
-        return False
-    
-    depart_x, depart_y = depart_button
-    safe_click(depart_x, depart_y)
-    time.sleep(1.0)
-    
-    # Check if mine turned green (successful) or stayed red (failed)
-    game_bounds, _ = find_game_window()
-    if game_bounds is None:
-        print(f"✗ {mine_name}: FAILED (could not verify result)")
-        stats['failed_attacks'] += 1
-        return False
-    
-    mine_area = get_mine_area(game_bounds)
-    green_centers, _ = detect_green_marks(game_bounds, mine_area)
-    
-    # Check if the original mine position now has a green mark nearby
-    original_x, original_y = mine_position
-    for green_pos in green_centers:
-        distance = np.sqrt((original_x - green_pos[0])**2 + (original_y - green_pos[1])**2)
-        if distance < 60:
-            print(f"✓ {mine_name}: SUCCESS")
-            stats['successful_attacks'] += 1
-            return True
+    path = checkpoint_state['path']
+    now = clock.time()
+    if path is None:
+        return
+    if not force and checkpoint_state['last_saved'] is not None and now - checkpoint_state['last_saved'] < CHECKPOINT_INTERVAL:
+        return
+    
+    sample_colors = window_cache['sample_colors']
+    state = {
+        'saved_at': datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S'),
+        'username': checkpoint_state['username'],
+        'power': checkpoint_state['power'],
+        'max_searches': checkpoint_state['max_searches'],
+        'session': event_log.session if event_log is not None else None,
+        'event_offset': event_log.start_offset if event_log is not None else None,
+        'stats': dict(stats),
+        'tracker': {'next_id': tracker.next_id, 'mines': list(tracker.mines.values())},
+        'calibration': calibration_profile,
+        'layout': {
+            'bounds': window_cache['bounds'],
+            'sample_colors': sample_colors.tolist() if sample_colors is not None else None
+        },
+        'mine_slots': mine_slots,
+        'button_cache': {color: {'position': cached['position'], 'bounds': cached['bounds']}
+                         for color, cached in button_cache.items()}
+    }
     
-    print(f"✗ {mine_name}: FAILED")
-    stats['failed_attacks'] += 1
-    return False
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f, default=lambda value: value.tolist())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    checkpoint_state['last_saved'] = now
 
 
-def classify_mines(centers, prefix):
+def load_checkpoint(path):
     """
-    Label mines simply as prefix1, prefix2, prefix3, prefix4.
+    Read a checkpoint file, or None if there is none.
     """
-    if len(centers) == 0:
-        return []
-    
-    results = []
-    for i, pos in enumerate(centers, 1):
-        results.append({
-            'position_name': f'{prefix}{i}',
-            'position': pos
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def restore_checkpoint(state):
+    """
+    Put a checkpoint's counters, tracked mines, calibration and window layout
+    back in place, so the session continues without window detection.
+    """
+    stats.update(state['stats'])
+    
+    if state.get('calibration'):
+        apply_calibration(state['calibration'])
+    
+    tracker.reset()
+    tracker.next_id = state['tracker']['next_id']
+    for mine in state['tracker']['mines']:
+        mine['position'] = tuple(mine['position'])
+        tracker.mines[mine['id']] = mine
+    
+    layout = state['layout']
+    if layout['bounds'] is not None:
+        bounds = tuple(layout['bounds'])
+        window_cache.update({
+            'bounds': bounds,
+            'mine_area': get_mine_area(bounds),
+            'dialog_area': get_dialog_area(bounds),
+            'search_area': get_search_area(bounds),
+            'sample_points': get_border_sample_points(bounds),
+            # The colors from before the restart, so a moved window is noticed
+            'sample_colors': np.array(layout['sample_colors'], np.int16) if layout['sample_colors'] is not None else None
         })
     
-    return results
+    mine_slots['positions'] = [tuple(p) for p in state['mine_slots']['positions']]
+    mine_slots['observations'] = [[tuple(p) for p in points] for points in state['mine_slots']['observations']]
+    for color, cached in state['button_cache'].items():
+        bounds = None if cached['bounds'] is None else tuple(cached['bounds'])
+        button_cache[color] = {'position': tuple(cached['position']), 'bounds': bounds, 'patch': None}
 
 
-def detect_mines():
+def finish_session(username, power, interrupted=False, lock=None):
     """
-    Detect all red and green mines.
+    Close the event log and store the session. An interrupted session keeps its
+    checkpoint and only updates the database; the CSV row is written once the
+    session finishes, after --resume if needed.
     """
-    game_bounds, _ = find_game_window()
-    
-    if game_bounds is None:
-        return None
-    
-    mine_area = get_mine_area(game_bounds)
-    
-    # Detect red and green marks
-    red_centers, _ = detect_red_marks(game_bounds, mine_area)
-    red_results = classify_mines(red_centers, 'red_mine')
-    
-    green_centers, _ = detect_green_marks(game_bounds, mine_area)
-    green_results = classify_mines(green_centers, 'green_mine')
-    
-    return {
-        'red_mines': red_results,
-        'green_mines': green_results
-    }
+    # The event log takes the same lock itself, so it is closed outside of it
+    guard = lock if lock is not None else contextlib.nullcontext()
+    if interrupted and checkpoint_state['path'] is not None:
+        save_checkpoint(force=True)
+        close_event_log('interrupted')
+        with guard:
+            store_session(session_row(username, power))
+        print(f"✓ Checkpoint saved to {checkpoint_state['path']}, continue with: "
+              f"python attack.py -u {username} -p {power} --resume")
+        return
+    
+    close_event_log()
+    with guard:
+        save_statistics_to_csv(username, power)
+    
+    path = checkpoint_state['path']
+    if path is not None and os.path.isfile(path):
+        os.remove(path)
+
+
+PIPELINE_METRIC_WINDOW = 2000   # Most recent samples kept for the pipeline's percentiles
+
+
+class DetectionPipeline:
+    """
+    Capture thread that keeps detection results for the most recent frames in a
+    small ring buffer. The action thread reads the latest state instead of
+    capturing and detecting itself, so CV work overlaps the decision code
+    (OpenCV releases the GIL). Detection is paused while an action is in
+    flight (see paused()): it updates window_cache and mine_slots, which the
+    action reads, and open dialogs over the mine area would churn the slots.
+    """
+
+    def __init__(self, size=4, interval=0.01):
+        self.buffer = deque(maxlen=size)
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.pause_event = threading.Event()
+        self.detecting = threading.Lock()   # Held by the capture thread for one capture and detection
+        self.thread = None
+        self.error = None
+        self.sequence = 0
+        self.last_read = 0
+        
+        # Metrics
+        self.produced = 0
+        self.dropped = 0
+        self.read = 0
+        self.busy_time = 0.0
+        self.started_at = None
+        self.staleness = deque(maxlen=PIPELINE_METRIC_WINDOW)
+        self.read_waits = deque(maxlen=PIPELINE_METRIC_WINDOW)
+        self.detect_times = deque(maxlen=PIPELINE_METRIC_WINDOW)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name='detection', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+        Stop detecting (after the one in progress) until the block is left.
+        """
+        self.pause_event.set()
+        with self.detecting:
+            pass
+        try:
+            yield
+        finally:
+            self.pause_event.clear()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.detecting:
+                if self.pause_event.is_set():
+                    frame = None
+                else:
+                    start = time.perf_counter()
+                    try:
+                        frame = capture_frame(window_cache['bounds'])
+                        results = detect_mines(frame)
+                    except Exception as e:
+                        with self.condition:
+                            self.error = e
+                            self.condition.notify_all()
+                        return
+                    elapsed = time.perf_counter() - start
+            if frame is None:
+                self.stop_event.wait(self.interval)
+                continue
+            
+            with self.condition:
+                self.sequence += 1
+                if len(self.buffer) == self.buffer.maxlen and self.buffer[0]['sequence'] > self.last_read:
+                    # Oldest entry is pushed out without anyone having read it
+                    self.dropped += 1
+                self.buffer.append({
+                    'sequence': self.sequence,
+                    'timestamp': frame.timestamp,
+                    'results': results
+                })
+                self.produced += 1
+                self.busy_time += elapsed
+                self.detect_times.append(elapsed * 1000)
+                self.condition.notify_all()
+            
+            self.stop_event.wait(self.interval)
+
+    def latest(self, newer_than=None, timeout=2.5):
+        """
+        Return detection results of the newest frame, waiting (up to timeout
+        seconds of real time) for one captured after newer_than if given.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                if self.buffer and (newer_than is None or self.buffer[-1]['timestamp'] > newer_than):
+                    break
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            
+            entry = self.buffer[-1]
+            self.last_read = entry['sequence']
+            self.read += 1
+        
+        self.read_waits.append((time.perf_counter() - start) * 1000)
+        self.staleness.append((clock.time() - entry['timestamp']) * 1000)
+        return copy.deepcopy(entry['results'])
+
+    def metrics(self):
+        """
+        Back-pressure and staleness figures for the end-of-run summary.
+        Percentiles cover the last PIPELINE_METRIC_WINDOW samples.
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        
+        def percentile(values, q):
+            return float(np.percentile(values, q)) if values else 0.0
+        
+        return {
+            'frames_produced': self.produced,
+            'frames_read': self.read,
+            'frames_dropped': self.dropped,
+            'capture_busy': self.busy_time / elapsed if elapsed else 0.0,
+            'detect_ms_p50': percentile(self.detect_times, 50),
+            'staleness_ms_p50': percentile(self.staleness, 50),
+            'staleness_ms_p95': percentile(self.staleness, 95),
+            'read_wait_ms_p50': percentile(self.read_waits, 50),
+            'read_wait_ms_p95': percentile(self.read_waits, 95)
+        }
+
+
+def detection_paused(pipeline):
+    """
+    Context for an action: the capture thread, if any, does not detect meanwhile.
+    """
+    return pipeline.paused() if pipeline is not None else contextlib.nullcontext()
+
+
+def print_pipeline_metrics(pipeline):
+    """
+    Print capture/detection thread metrics.
+    """
+    metrics = pipeline.metrics()
+    print("PIPELINE")
+    print("="*70)
+    print(f"Frames Produced:     {metrics['frames_produced']} ({metrics['frames_read']} read, {metrics['frames_dropped']} dropped unread)")
+    print(f"Capture Thread Busy: {metrics['capture_busy']*100:.1f}%")
+    print(f"Detection Time:      p50 {metrics['detect_ms_p50']:.1f} ms")
+    print(f"State Staleness:     p50 {metrics['staleness_ms_p50']:.1f} ms, p95 {metrics['staleness_ms_p95']:.1f} ms")
+    print(f"Action Thread Wait:  p50 {metrics['read_wait_ms_p50']:.1f} ms, p95 {metrics['read_wait_ms_p95']:.1f} ms")
+    print("="*70)
+
+
+def print_profile_summary():
+    """
+    Print p50/p95 per stage and how the session split between sleeping and computing.
+    With --pipeline the capture thread's spans count too, so the shares can overlap.
+    """
+    stages = profiler.summary()
+    if not stages:
+        return
+    shares = profiler.shares(stages)
+    print("PROFILE")
+    print("="*70)
+    for name, values in sorted(stages.items(), key=lambda item: -item[1]['total_s']):
+        print(f"{name:<28} n {values['count']:>6}  p50 {values['p50_ms']:8.2f} ms  p95 {values['p95_ms']:8.2f} ms  "
+              f"total {values['total_s']:7.2f} s")
+    print("-"*70)
+    print(f"Session Time:        {profiler.elapsed():.1f} s")
+    print(f"Sleeping:            {shares['sleep']*100:.1f}%")
+    print(f"Computing:           {shares['compute']*100:.1f}%")
+    print(f"Clicking:            {shares['input']*100:.1f}%")
+    print(f"Other:               {shares['other']*100:.1f}%")
+    print("="*70)
 
 
 def print_statistics(username, power):
@@ -524,28 +2338,61 @@ def print_statistics(username, power):
     print(f"Troops Returned:     {stats['troops_returned']}")
     print("="*70)
 
-def hit_mines(username=None, power=None, max_searches=30):
-    failed_mines = set()
+def hit_mines(username=None, power=None, max_searches=30, pipeline=None, min_win_chance=MIN_WIN_CHANCE, resume=False,
+              history_db=stats_db.DB_FILE):
+    """
+    Attack the mines with the best estimated win chance first, return troops and
+    search for new mines until the search budget is used up. A batch is left
+    early when no remaining mine is estimated to win at least min_win_chance
+    while a new batch is (see WinEstimator.worth_skipping).
+    With resume the tracked mines restored from a checkpoint are kept.
+    Past attacks are loaded from history_db; None starts without history.
+    """
+    if not resume:
+        tracker.reset()
+    last_action = None
+    
+    estimator = WinEstimator(power or '')
+    history = estimator.load_history(history_db) if history_db else 0
+    if history:
+        print(f"✓ Loaded {history} past attacks, {estimator.estimate():.0%} estimated win chance for {power}")
     
     while True:
-        # Detect current mine status
-        results = detect_mines()
+        # Detect current mine status (from the capture thread when pipelined)
+        if pipeline is not None:
+            results = pipeline.latest(newer_than=last_action)
+        else:
+            results = detect_mines()
         
         if results is None:
             print("✗ ERROR: Could not detect mines!")
             break
         
+        tracker.update(results)
+        save_checkpoint()
+        
         red_mines = results['red_mines']
         green_mines = results['green_mines']
         
         print(f"\n[{len(red_mines)} RED, {len(green_mines)} GREEN, Search {stats['searches_performed']}/{max_searches}]")
         
-        # Filter out failed mines
-        attackable_mines = [m for m in red_mines if m['position_name'] not in failed_mines]
+        # Filter out failed mines and attack the most winnable one first
+        attackable_mines = [m for m in red_mines if not tracker.failed(m['mine_id'])]
+        for mine in attackable_mines:
+            mine['win_chance'] = estimator.estimate(window_location(mine['position']))
+        attackable_mines.sort(key=lambda m: -m['win_chance'])
         
-        if not attackable_mines:
+        can_search = max_searches == 0 or stats['searches_performed'] < max_searches
+        give_up = can_search and estimator.worth_skipping(
+            [window_location(m['position']) for m in attackable_mines], min_win_chance)
+        
+        if not attackable_mines or give_up:
             # No more attackable mines in current batch
-            if len(red_mines) == 0:
+            if give_up:
+                # Not worth a troop; a new batch is expected to do better
+                print(f"\n✗ Best remaining mine has a {attackable_mines[0]['win_chance']:.0%} win chance "
+                      f"(below {min_win_chance:.0%}), skipping {len(attackable_mines)} mines.")
+            elif len(red_mines) == 0:
                 # All mines cleared successfully
                 print("\n✓ All current red mines cleared!")
             else:
@@ -553,22 +2400,22 @@ def hit_mines(username=None, power=None, max_searches=30):
                 print(f"\n✗ All remaining {len(red_mines)} red mines have failed.")
             
             # Check if we can search for more
-            if max_searches == 0 or stats['searches_performed'] < max_searches:
+            if can_search:
                 print(f"→ Searching for new mines...")
                 
-                # First, return all troops from green mines
-                if green_mines:
-                    for green_mine in green_mines:
-                        return_troops_from_mine(green_mine['position'], green_mine['position_name'])
-                        time.sleep(0.2)
-                
-                # Now search for new mines
-                search_success = search_for_new_mines()
+                with detection_paused(pipeline):
+                    # First, return all troops from green mines
+                    return_troops(tracker.visible('green'))
+                    
+                    # Now search for new mines
+                    search_success = search_for_new_mines()
                 stats['searches_performed'] += 1  # Increment here
+                last_action = clock.time()
                 
                 if search_success:
-                    # Clear failed mines list for new set
-                    failed_mines.clear()
+                    # Forget tracked mines, a new set is on screen
+                    tracker.reset()
+                    save_checkpoint(force=True)
                     print("✓ New mines found!\n")
                     
                     # Continue attacking the new mines even if we've hit max_searches
@@ -582,29 +2429,29 @@ def hit_mines(username=None, power=None, max_searches=30):
                 print(f"\n✗ Reached maximum searches ({max_searches}). Stopping.\n")
                 break
         
-        # Attack the first available red mine
+        # Attack the red mine most likely to be won
         target_mine = attackable_mines[0]
-        success = attack_mine(target_mine['position'], target_mine['position_name'])
-        
-        if success:
-            # Check if there are still red mines remaining
-            time.sleep(0.2)
-            results = detect_mines()
-            if results and len(results['red_mines']) > 0:
+        with detection_paused(pipeline):
+            outcome = attack_mine(target_mine['position'], f"{target_mine['position_name']} (#{target_mine['mine_id']}, "
+                                  f"{target_mine['win_chance']:.0%})", target_mine['mine_id'])
+            success = outcome == 'success'
+            
+            # The tracker already knows the mine turned green, so no re-detection is needed
+            if success and tracker.visible('red'):
                 # Return troops from all green mines
-                for green_mine in results['green_mines']:
-                    return_troops_from_mine(green_mine['position'], green_mine['position_name'])
-                    time.sleep(0.2)
-        else:
-            # Mark this mine as failed
-            failed_mines.add(target_mine['position_name'])
+                return_troops(tracker.visible('green'))
+        if outcome in ('success', 'failed'):
+            # Only battles say something about the spot; UI misses are left out, as in load_history
+            estimator.record(window_location(target_mine['position']), success)
         
-        # Small delay before next iteration
-        time.sleep(0.2)
+        # Only trust frames captured after the screen reacted to this attack
+        last_action = clock.time()
 
-def attack_all_red_mines(username=None, power=None, max_searches=30):
+def attack_all_red_mines(username=None, power=None, max_searches=30, pipelined=False, profile=None,
+                         min_win_chance=MIN_WIN_CHANCE, resume=False):
     """
     Main function to attack all red mines and manage troops.
+    With profile (a path prefix) the stage histograms and a Chrome trace are saved.
     """
     print("\n" + "="*70)
     print("STARTING AUTOMATED MINE ATTACK SEQUENCE")
@@ -613,13 +2460,165 @@ def attack_all_red_mines(username=None, power=None, max_searches=30):
     print(f"Maximum searches allowed: {max_searches}")
     print("="*70 + "\n")
     
-    hit_mines(username, power, max_searches)
+    profiler.reset()
+    # Without --profile spans are not recorded at all, so unlimited runs keep no per-span state
+    profiler.enabled = profiler.tracing = profile is not None
+    
+    pipeline = DetectionPipeline().start() if pipelined else None
+    try:
+        hit_mines(username, power, max_searches, pipeline, min_win_chance, resume)
+        stop_input_dispatcher()
+    finally:
+        # After an error the input thread may still be inside a wait, so it is not waited for
+        stop_input_dispatcher(wait=False)
+        if pipeline is not None:
+            pipeline.stop()
+        profiler.stop()
     
     # Final summary
-    stats['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    stats['end_time'] = datetime.fromtimestamp(clock.time()).strftime('%Y-%m-%d %H:%M:%S')
     print_statistics(username, power)
+    if pipeline is not None:
+        print_pipeline_metrics(pipeline)
+    print_profile_summary()
+    
+    if profile is not None:
+        stages_path, trace_path = profiler.write(profile)
+        print(f"✓ Profile saved to {stages_path} and {trace_path}")
+
+class PrefixedOutput:
+    """
+    Prefix every printed line with the account name, so output from several
+    worker processes can be told apart.
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.at_line_start = True
+
+    def write(self, text):
+        for part in text.splitlines(keepends=True):
+            if self.at_line_start:
+                self.stream.write(self.prefix)
+            self.stream.write(part)
+            self.at_line_start = part.endswith('\n')
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_instance(username, power, game_bounds, max_searches, input_lock, file_lock, results, record=None, pipelined=False,
+                 profile=None, min_win_chance=MIN_WIN_CHANCE, calibration=None, resume=False, detection_scale=1,
+                 dry_run=False):
+    """
+    Worker process: run an independent attack loop on one game window.
+    Clicks go through the shared input lock, capture and detection run in parallel.
+    With resume the account's checkpoint is restored instead of starting afresh.
+    """
+    global input_backend, capture_backend, window_search_area, DETECTION_SCALE, template_file_lock
+    
+    sys.stdout = PrefixedOutput(sys.stdout, f"[{username}] ")
+    cv2.setNumThreads(1)  # One process per core already
+    load_calibration(calibration)  # Spawned workers do not inherit the parent's globals
+    template_file_lock = file_lock
+    load_button_templates()
+    DETECTION_SCALE = detection_scale
+    
+    if dry_run:
+        input_backend = RecordingInput(now=lambda: clock.time())
+    input_backend = ArbitratedInput(input_backend, input_lock)
+    if record:
+        capture_backend = RecordingCapture(capture_backend, os.path.join(record, username))
+    
+    # Only ever look for this account's window around its own bounds
+    x, y, w, h = game_bounds
+    margin = 40
+    window_search_area = (max(x - margin, 0), max(y - margin, 0), w + 2 * margin, h + 2 * margin)
+    
+    checkpoint_state.update({'path': checkpoint_path(username), 'username': username, 'power': power, 'max_searches': max_searches})
+    resumed = load_checkpoint(checkpoint_state['path']) if resume else None
+    if resumed is not None:
+        restore_checkpoint(resumed)
+        power = checkpoint_state['power'] = resumed['power']
+        max_searches = checkpoint_state['max_searches'] = resumed['max_searches']
+    else:
+        cache_game_window(game_bounds, capture_frame(window_search_area))
+        stats['start_time'] = datetime.fromtimestamp(clock.time()).strftime('%Y-%m-%d %H:%M:%S')
+    
+    open_event_log(username, power, file_lock, session=resumed['session'] if resumed else None,
+                   start_offset=resumed.get('event_offset') if resumed else None)
+    interrupted = True
+    try:
+        attack_all_red_mines(username, power, max_searches=max_searches, pipelined=pipelined,
+                             profile=f"{profile}_{username}" if profile else None, min_win_chance=min_win_chance,
+                             resume=resumed is not None)
+        interrupted = False
+    finally:
+        finish_session(username, power, interrupted, file_lock)
+        results.put(dict(stats))
+
+
+def run_instances(usernames, powers, max_searches, record=None, pipelined=False, profile=None, min_win_chance=MIN_WIN_CHANCE,
+                  calibration=None, resume=False, detection_scale=1, dry_run=False):
+    """
+    Find one game window per account and drive each from its own process.
+    Windows are matched to usernames from left to right. With resume every
+    account continues from its checkpoint, including its window bounds.
+    """
+    if resume:
+        states = [load_checkpoint(checkpoint_path(username)) for username in usernames]
+        missing = [username for username, state in zip(usernames, states) if state is None]
+        if missing:
+            print(f"✗ ERROR: no checkpoint to resume for {', '.join(missing)}")
+            return
+        windows = [tuple(state['layout']['bounds']) for state in states]
+        powers = [state['power'] for state in states]
+    else:
+        windows = find_game_windows(count=len(usernames))
+    if len(windows) < len(usernames):
+        print(f"✗ ERROR: found {len(windows)} game windows, need {len(usernames)}")
+        return
+    
+    input_lock = multiprocessing.Lock()
+    file_lock = multiprocessing.Lock()
+    results = multiprocessing.Queue()
+    
+    workers = []
+    for username, power, bounds in zip(usernames, powers, windows):
+        print(f"→ {username}: window at {bounds}")
+        worker = multiprocessing.Process(
+            target=run_instance,
+            args=(username, power, bounds, max_searches, input_lock, file_lock, results, record, pipelined, profile,
+                  min_win_chance, calibration, resume, detection_scale, dry_run),
+            name=f"bot-{username}"
+        )
+        worker.start()
+        workers.append(worker)
+    
+    summaries = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    
+    print("\n" + "="*70)
+    print("ALL ACCOUNTS")
+    print("="*70)
+    for summary in sorted(summaries, key=lambda s: s['username']):
+        rate = summary['successful_attacks'] / max(summary['total_attacks'], 1) * 100
+        print(f"{summary['username']:<20} {summary['successful_attacks']:>4}/{summary['total_attacks']:<4} wins ({rate:.1f}%)  "
+              f"{summary['searches_performed']} searches")
+    print("="*70)
+
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        stats_db.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'calibrate':
+        calibrate_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description='Automated Mine Attack System for Whitehill',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -628,18 +2627,23 @@ Examples:
   python attack.py -u John -p 484Fire
   python attack.py -u Jane -p 500Archer -s 50
   python attack.py --username Bob --power 450Earth --searches 0
+  python attack.py -n 3 -u John Jane Bob -p 484Fire 500Archer 450Earth
+  python attack.py stats --since 2025-01-01
+  python attack.py calibrate
         '''
     )
     
     parser.add_argument('-u', '--username', 
                        type=str, 
+                       nargs='+',
                        required=True,
-                       help='Player username')
+                       help='Player username (one per game window with --instances)')
     
     parser.add_argument('-p', '--power', 
                        type=str, 
-                       required=True,
-                       help='Top troop power and type (e.g., 484Fire)')
+                       nargs='+',
+                       help='Top troop power and type (e.g., 484Fire), one per username or one for all '
+                            '(required unless --resume, which takes it from the checkpoint)')
     
     parser.add_argument('-s', '--searches', 
                        type=int, 
@@ -651,10 +2655,106 @@ Examples:
                        default=2,
                        help='Countdown delay in seconds before starting (default: 2)')
     
+    parser.add_argument('--record',
+                       type=str,
+                       metavar='DIR',
+                       help='Save every captured frame to DIR for offline replay')
+    
+    parser.add_argument('--pipeline',
+                       action='store_true',
+                       help='Run capture and detection on a separate thread')
+    
+    parser.add_argument('--profile',
+                       type=str,
+                       nargs='?',
+                       const='profile',
+                       metavar='PREFIX',
+                       help='Save per-stage latency histograms to PREFIX_stages.json and a Chrome trace to PREFIX_trace.json (default prefix: profile)')
+    
+    parser.add_argument('--min-win-chance',
+                       type=float,
+                       default=MIN_WIN_CHANCE,
+                       help=f'Search early when no remaining mine is estimated to win this often (default: {MIN_WIN_CHANCE}, 0 disables)')
+    
+    parser.add_argument('--calibration',
+                       type=str,
+                       default=CALIBRATION_FILE,
+                       metavar='FILE',
+                       help=f'Calibration profile to load if it exists (default: {CALIBRATION_FILE}, see: attack.py calibrate)')
+    
+    parser.add_argument('--coarse-scale',
+                       type=int,
+                       choices=[1, 2, 4],
+                       default=1,
+                       help='Find colors on a 1/N size image first and only refine around them at full resolution (default: 1, off)')
+    
+    parser.add_argument('--dry-run',
+                       action='store_true',
+                       help='Record clicks instead of sending them (detection and waits only, the game is not touched)')
+    
+    parser.add_argument('--resume',
+                       action='store_true',
+                       help='Continue the interrupted session from its checkpoint (no countdown or window detection)')
+    
+    parser.add_argument('-n', '--instances',
+                       type=int,
+                       default=1,
+                       help='Number of game windows to drive, one worker process each (default: 1)')
+    
     args = parser.parse_args()
     
-    # Record start time
-    stats['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if len(args.username) != args.instances:
+        parser.error(f"--instances {args.instances} needs exactly {args.instances} usernames")
+    if args.power is None:
+        if not args.resume:
+            parser.error("the following arguments are required: -p/--power")
+        args.power = [None]  # Taken from each checkpoint
+    if len(args.power) not in (1, len(args.username)):
+        parser.error("give one --power for all accounts or one per username")
+    powers = args.power * len(args.username) if len(args.power) == 1 else args.power
+    
+    # Measured once with 'attack.py calibrate'; nothing is recomputed here
+    load_calibration(args.calibration)
+    load_button_templates()
+    
+    global DETECTION_SCALE, input_backend
+    DETECTION_SCALE = args.coarse_scale
+    if args.dry_run:
+        # Detection runs on the live screen, clicks are only recorded
+        input_backend = RecordingInput(now=lambda: clock.time())
+    
+    if args.instances > 1:
+        if not args.resume:
+            print(f"Starting {args.instances} instances in {args.delay} seconds... Make sure all game windows are visible!")
+            clock.sleep(args.delay)
+        run_instances(args.username, powers, args.searches, args.record, args.pipeline, args.profile, args.min_win_chance,
+                      args.calibration, args.resume, args.coarse_scale, args.dry_run)
+        return
+    
+    args.username, args.power = args.username[0], powers[0]
+    
+    if args.record:
+        global capture_backend
+        capture_backend = RecordingCapture(capture_backend, args.record)
+    
+    checkpoint_state.update({'path': checkpoint_path(args.username), 'username': args.username, 'power': args.power,
+                             'max_searches': args.searches})
+    resumed = None
+    if args.resume:
+        # Continue the interrupted session: same counters, search budget and window
+        resumed = load_checkpoint(checkpoint_state['path'])
+        if resumed is None:
+            print(f"✗ ERROR: no checkpoint {checkpoint_state['path']} to resume")
+            return
+        restore_checkpoint(resumed)
+        args.power = checkpoint_state['power'] = resumed['power']
+        args.searches = checkpoint_state['max_searches'] = resumed['max_searches']
+    else:
+        if os.path.isfile(checkpoint_state['path']):
+            print(f"→ Starting a new session; the unfinished one in {checkpoint_state['path']} will be replaced (see --resume)")
+        
+        # Record start time
+        stats['start_time'] = datetime.fromtimestamp(clock.time()).strftime('%Y-%m-%d %H:%M:%S')
     
     print("="*70)
     print("Mine Detection & Attack System")
@@ -662,16 +2762,26 @@ Examples:
     print(f"Player:   {args.username}")
     print(f"Power:    {args.power}")
     print(f"Searches: {args.searches if args.searches > 0 else 'Unlimited'}")
-    print(f"\nStarting in {args.delay} seconds... Make sure game window is visible!")
+    if resumed:
+        print(f"\nResuming the session saved at {resumed['saved_at']}: {stats['total_attacks']} attacks, "
+              f"{stats['searches_performed']} searches used")
+    else:
+        print(f"\nStarting in {args.delay} seconds... Make sure game window is visible!")
     print("="*70)
     
-    time.sleep(args.delay)
-    
-    # Run attack sequence
-    attack_all_red_mines(args.username, args.power, max_searches=args.searches)
-    
-    # Save to CSV
-    save_statistics_to_csv(args.username, args.power)
+    if not resumed:
+        clock.sleep(args.delay)
+    
+    # Run attack sequence; an interrupted session is checkpointed for --resume
+    open_event_log(args.username, args.power, session=resumed['session'] if resumed else None,
+                   start_offset=resumed.get('event_offset') if resumed else None)
+    interrupted = True
+    try:
+        attack_all_red_mines(args.username, args.power, max_searches=args.searches, pipelined=args.pipeline,
+                             profile=args.profile, min_win_chance=args.min_win_chance, resume=resumed is not None)
+        interrupted = False
+    finally:
+        finish_session(args.username, args.power, interrupted)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""
+Compare attack.cluster_points against sklearn's DBSCAN (eps=45, min_samples=1).
+
+Point sets come from recorded frames (the contour centers detect_mines feeds into
+clustering) and, optionally, from random synthetic sets.
+
+    python bench/bench_clustering.py --frames recordings/session1
+    python bench/bench_clustering.py --random 500
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+from capture import ReplayCapture, ReplayFinished
+from run_bench import reset_detector_state
+
+
+def collect_frame_point_sets(directory):
+    """
+    Replay recorded frames through detect_mines and capture every point set
+    it hands to the clusterer.
+    """
+    point_sets = []
+    original = attack.cluster_points
+
+    def recording_cluster_points(points, eps=45):
+        point_sets.append([tuple(p) for p in points])
+        return original(points, eps)
+
+    attack.capture_backend = ReplayCapture(directory)
+    attack.cluster_points = recording_cluster_points
+    try:
+        while True:
+            # Without learned slots every frame goes through segmentation and clustering
+            reset_detector_state()
+            attack.detect_mines()
+    except ReplayFinished:
+        pass
+    finally:
+        attack.cluster_points = original
+
+    return point_sets
+
+
+def random_point_sets(count, seed=0):
+    """
+    Random sets shaped like noisy mine frames: a few marks, each split into several specks.
+    """
+    rng = np.random.default_rng(seed)
+    point_sets = []
+    for _ in range(count):
+        marks = rng.uniform(0, 600, size=(rng.integers(1, 7), 2))
+        specks = np.concatenate([m + rng.normal(0, 20, size=(rng.integers(1, 6), 2)) for m in marks])
+        point_sets.append([(int(x), int(y)) for x, y in specks])
+    return point_sets
+
+
+def same_partition(labels_a, labels_b):
+    """
+    True if two labelings group the points identically (label numbers may differ).
+    """
+    pairs = set(zip(labels_a, labels_b))
+    return len(pairs) == len(set(labels_a)) == len(set(labels_b))
+
+
+def time_calls(func, point_sets, repeat):
+    durations = []
+    for points in point_sets:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(points)
+        durations.append((time.perf_counter() - start) / repeat * 1000)
+    return np.array(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the in-house clusterer against DBSCAN')
+    parser.add_argument('--frames', type=str, help='Directory of recorded frames')
+    parser.add_argument('--random', type=int, default=0, help='Number of random point sets to add')
+    parser.add_argument('--repeat', type=int, default=20, help='Calls per point set when timing')
+    args = parser.parse_args()
+
+    point_sets = []
+    if args.frames:
+        point_sets += collect_frame_point_sets(args.frames)
+    if args.random:
+        point_sets += random_point_sets(args.random)
+    point_sets = [p for p in point_sets if p]
+
+    if not point_sets:
+        print("✗ No point sets to cluster (use --frames and/or --random)")
+        return
+
+    from sklearn.cluster import DBSCAN
+
+    def dbscan(points):
+        return DBSCAN(eps=45, min_samples=1).fit(np.array(points)).labels_
+
+    def in_house(points):
+        return attack.cluster_points(points, 45)
+
+    mismatches = sum(not same_partition(dbscan(p), in_house(p)) for p in point_sets)
+
+    print("="*70)
+    print(f"Point sets:       {len(point_sets)} (avg {np.mean([len(p) for p in point_sets]):.1f} points)")
+    print(f"Mismatches:       {mismatches}")
+    for name, func in (('DBSCAN', dbscan), ('cluster_points', in_house)):
+        durations = time_calls(func, point_sets, args.repeat)
+        print(f"{name:<17} p50 {np.percentile(durations, 50):.3f} ms   p95 {np.percentile(durations, 95):.3f} ms")
+    print("="*70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Memory churn of one polling tick with and without the buffer pool.
+
+A tick is what wait_for_state() and the mine scan do per poll: capture the
+game window, take its signature, look for the red button and detect red and
+green marks. Each mode runs in its own process and reports the buffers
+allocated per tick, the peak of short-lived Python-visible allocations per
+tick (tracemalloc, which sees NumPy and OpenCV result arrays) and the
+steady-state RSS.
+
+    python bench/bench_memory.py
+    python bench/bench_memory.py --frames recordings/session1 --ticks 2000
+
+Without --frames the simulator's screen is used. Replayed frames are read
+from disk on every tick, which adds the same allocation to both modes.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+from buffers import buffer_pool
+from capture import ReplayCapture
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb():
+    """
+    Resident set size of this process, or None if it cannot be read.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def use_source(frames):
+    """
+    Point attack at the capture source and return the detected window layout.
+    """
+    if frames:
+        attack.capture_backend = ReplayCapture(frames, loop=True)
+    else:
+        import simulator
+        clock = simulator.VirtualClock(include_compute=False)
+        game = simulator.SimulatedGame(clock)
+        attack.clock = clock
+        attack.capture_backend = game
+
+    bounds, _ = attack.find_game_window(attack.capture_frame())
+    if bounds is None:
+        raise SystemExit("✗ No game window in the first frame")
+    return {
+        'bounds': bounds,
+        'mine_area': attack.get_mine_area(bounds),
+        'search_area': attack.get_search_area(bounds)
+    }
+
+
+def tick(layout, reference):
+    frame = attack.capture_frame(layout['bounds'])
+    signature = attack.roi_signature(frame)
+    attack.region_changed(signature, reference)
+    attack.find_button('red', layout['search_area'], frame)
+    attack.detect_red_marks(layout['bounds'], layout['mine_area'], frame)
+    attack.detect_green_marks(layout['bounds'], layout['mine_area'], frame)
+    return signature
+
+
+def run(pooled, frames, ticks, warmup):
+    """
+    Run ticks in this process and return its measurements.
+    """
+    buffer_pool.enabled = pooled
+    layout = use_source(frames)
+
+    reference = None
+    for _ in range(warmup):
+        reference = tick(layout, reference)
+
+    rss_start = rss_mb()
+    counters = buffer_pool.stats()
+    tracemalloc.start()
+    peaks = []
+    durations = []
+    for _ in range(ticks):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        reference = tick(layout, reference)
+        durations.append((time.perf_counter() - start) * 1000)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    rss_end = rss_mb()
+
+    after = buffer_pool.stats()
+    return {
+        'mode': 'pool' if pooled else 'no pool',
+        'buffers_per_tick': (after['allocated'] - counters['allocated']) / ticks,
+        'requests_per_tick': (after['taken'] - counters['taken']) / ticks,
+        'peak_kb_p50': float(np.percentile(peaks, 50)) / 1024,
+        'peak_kb_max': float(np.max(peaks)) / 1024,
+        'tick_ms_p50': float(np.percentile(durations, 50)),
+        'rss_mb': rss_end,
+        'rss_growth_mb': None if rss_start is None else rss_end - rss_start,
+        'pool_held_mb': after['held_bytes'] / 2**20
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-tick allocations with and without the buffer pool')
+    parser.add_argument('--frames', type=str, help='Directory of recorded frames (default: simulator screen)')
+    parser.add_argument('--ticks', type=int, default=500, help='Measured ticks per mode (default: 500)')
+    parser.add_argument('--warmup', type=int, default=50, help='Ticks before measuring (default: 50)')
+    parser.add_argument('--mode', choices=['pool', 'no-pool'], help='Run one mode in this process and print JSON')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode == 'pool', args.frames, args.ticks, args.warmup)))
+        return
+
+    results = []
+    for mode in ('no-pool', 'pool'):
+        command = [sys.executable, os.path.abspath(__file__), '--mode', mode,
+                   '--ticks', str(args.ticks), '--warmup', str(args.warmup)]
+        if args.frames:
+            command += ['--frames', args.frames]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    def number(value, fmt):
+        return 'n/a' if value is None else format(value, fmt)
+
+    print("="*70)
+    print(f"{'':<10}{'buffers/tick':>14}{'peak KB p50':>13}{'peak KB max':>13}{'tick ms':>9}{'RSS MB':>9}{'growth':>9}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['buffers_per_tick']:>14.2f}{r['peak_kb_p50']:>13.1f}{r['peak_kb_max']:>13.1f}"
+              f"{r['tick_ms_p50']:>9.2f}{number(r['rss_mb'], '.1f'):>9}{number(r['rss_growth_mb'], '+.1f'):>9}")
+    print(f"Pool requests per tick: {results[1]['requests_per_tick']:.1f}, held by the pool: {results[1]['pool_held_mb']:.1f} MB")
+    print("="*70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Wins per hour with and without skipping hopeless batches (--min-win-chance),
+on the simulator.
+
+Each run is a separate simulator.py process on the pure virtual clock, so the
+two modes see the same games for the same seed. Skipping must never cost wins
+per hour: the simulated game gives every spot the same odds, so a batch should
+only be skipped once the estimates really tell spots apart.
+
+    python bench/bench_skipping.py
+    python bench/bench_skipping.py --win-rates 0.08 0.5 --seeds 0 1 2 --searches 60
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'simulator.py')
+
+
+def simulate(win_rate, seed, searches, min_win_chance):
+    """
+    Wins per hour, attacks and skipped batches of one simulator run.
+    """
+    command = [sys.executable, SIMULATOR, '--pure-virtual', '--win-rate', str(win_rate), '--seed', str(seed),
+               '--searches', str(searches), '--min-win-chance', str(min_win_chance)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return {
+        'wins_per_hour': float(re.search(r'^Wins per Hour:\s+([\d.]+)', output, re.M).group(1)),
+        'battles': int(re.search(r'^Simulated Battles:\s+(\d+)', output, re.M).group(1)),
+        'skipped': output.count('skipping')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare wins per hour with and without skipping hopeless batches')
+    parser.add_argument('--win-rates', type=float, nargs='+', default=[0.08, 0.2, 0.5], help='Simulated win rates')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1], help='Simulator seeds')
+    parser.add_argument('--searches', type=int, default=30, help='Searches per run (default: 30)')
+    parser.add_argument('--min-win-chance', type=float, default=attack.MIN_WIN_CHANCE,
+                        help=f'Skipping threshold to test (default: {attack.MIN_WIN_CHANCE})')
+    args = parser.parse_args()
+
+    print("="*70)
+    print(f"{'win rate':<10}{'seed':>6}{'wins/h off':>12}{'wins/h on':>11}{'battles':>13}{'skipped':>9}")
+    worse = 0
+    for win_rate in args.win_rates:
+        for seed in args.seeds:
+            off = simulate(win_rate, seed, args.searches, 0)
+            on = simulate(win_rate, seed, args.searches, args.min_win_chance)
+            worse += on['wins_per_hour'] < off['wins_per_hour']
+            print(f"{win_rate:<10.2f}{seed:>6}{off['wins_per_hour']:>12.1f}{on['wins_per_hour']:>11.1f}"
+                  f"{off['battles']:>6} / {on['battles']:<4}{on['skipped']:>9}")
+    print(f"{'✗' if worse else '✓'} Skipping lowered wins per hour in {worse} runs")
+    print("="*70)
+
+
+if __name__ == "__main__":
+    main()
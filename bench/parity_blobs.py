@@ -0,0 +1,142 @@
+"""
+Parity check: connected-components blob detection vs the previous
+findContours + moments loop, on recorded frames.
+
+For every frame the same cleaned masks are fed to both paths and the resulting
+mark centers and button centers are compared.
+
+    python bench/parity_blobs.py --frames recordings/session1
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+from capture import ReplayCapture
+
+
+def contour_points(mask, min_area):
+    """
+    The original per-contour loop, kept here as the reference implementation.
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    points = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > min_area:
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                points.append((int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])))
+    return points
+
+
+def contour_largest(mask, min_area):
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    largest_contour = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(largest_contour) > min_area:
+        M = cv2.moments(largest_contour)
+        if M["m00"] != 0:
+            return (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+    return None
+
+
+def blob_points(mask, min_area):
+    _, centroids = attack.find_blobs(mask, min_area)
+    return [tuple(p) for p in centroids.astype(int).tolist()]
+
+
+def blob_largest(mask, min_area):
+    areas, centroids = attack.find_blobs(mask, min_area)
+    if len(areas) == 0:
+        return None
+    return tuple(centroids[areas.argmax()].astype(int).tolist())
+
+
+def points_match(reference, candidate, tolerance):
+    """
+    True if both lists have the same length and every reference point has a
+    candidate within tolerance pixels.
+    """
+    if len(reference) != len(candidate):
+        return False
+    remaining = list(candidate)
+    for rx, ry in reference:
+        best = min(remaining, key=lambda p: (p[0] - rx) ** 2 + (p[1] - ry) ** 2)
+        if (best[0] - rx) ** 2 + (best[1] - ry) ** 2 > tolerance ** 2:
+            return False
+        remaining.remove(best)
+    return True
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare blob detection against the contour loop')
+    parser.add_argument('--frames', type=str, required=True, help='Directory of recorded full-screen frames')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='Allowed centroid difference in pixels')
+    args = parser.parse_args()
+
+    replay = ReplayCapture(args.frames)
+    checks = mismatches = 0
+    durations = {'contours': [], 'blobs': []}
+
+    for path in replay.paths:
+        bgr, origin = replay.load(path)
+        frame = attack.Frame(bgr, origin)
+        game_bounds, _ = attack.find_game_window(frame)
+        if game_bounds is None:
+            print(f"- {os.path.basename(path)}: no game window, skipped")
+            continue
+
+        cases = []
+        mine_labels = frame.crop(attack.get_mine_area(game_bounds)).labels
+        for color, min_area in (('red_mark', 150), ('green_mark', 100)):
+            mask = attack.color_mask(mine_labels, color)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, attack.MARK_KERNEL)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, attack.MARK_KERNEL)
+            cases.append((color, mask, min_area, contour_points, blob_points))
+
+        for area, colors in ((attack.get_dialog_area(game_bounds), ('red', 'green', 'yellow')),
+                             (attack.get_search_area(game_bounds), ('blue',))):
+            labels = frame.crop(area).labels
+            for color in colors:
+                mask = attack.color_mask(labels, f'{color}_button')
+                mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, attack.BUTTON_KERNEL)
+                cases.append((f'{color}_button', mask, attack.BUTTON_MIN_AREA[color], contour_largest, blob_largest))
+
+        for name, mask, min_area, reference_func, blob_func in cases:
+            reference, reference_ms = timed(reference_func, mask, min_area)
+            candidate, blob_ms = timed(blob_func, mask, min_area)
+            durations['contours'].append(reference_ms)
+            durations['blobs'].append(blob_ms)
+
+            reference_list = [] if reference is None else (reference if isinstance(reference, list) else [reference])
+            candidate_list = [] if candidate is None else (candidate if isinstance(candidate, list) else [candidate])
+            checks += 1
+            if not points_match(reference_list, candidate_list, args.tolerance):
+                mismatches += 1
+                print(f"✗ {os.path.basename(path)} {name}: contours {reference_list} vs blobs {candidate_list}")
+
+    print("="*70)
+    print(f"Checks:      {checks}")
+    print(f"Mismatches:  {mismatches}")
+    for name, values in durations.items():
+        if values:
+            print(f"{name:<12} p50 {np.percentile(values, 50):.3f} ms   p95 {np.percentile(values, 95):.3f} ms")
+    print("="*70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Parity check: coarse-to-fine detection (DETECTION_SCALE 2 and 4) against
+full-resolution detection, on recorded frames.
+
+For every frame the game window, the red and green marks and every button are
+detected at full resolution and at each coarse scale, and the results are
+compared. --upscale enlarges the frames first to stand in for a high-DPI screen.
+
+    python bench/parity_pyramid.py --frames recordings/session1
+    python bench/parity_pyramid.py --frames recordings/session1 --upscale 2 --scales 2 4
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+from capture import ReplayCapture
+from parity_blobs import points_match
+
+
+def detect_all(bgr, origin, scale):
+    """
+    Everything the bot detects on one frame at one DETECTION_SCALE, and the time it took.
+    """
+    attack.DETECTION_SCALE = scale
+    frame = attack.Frame(bgr, origin)
+    start = time.perf_counter()
+
+    results = {}
+    bounds, _ = attack.find_game_window(frame)
+    results['window'] = bounds
+    if bounds is not None:
+        mine_area = attack.get_mine_area(bounds)
+        results['red_marks'] = attack.detect_red_marks(bounds, mine_area, frame)[0]
+        results['green_marks'] = attack.detect_green_marks(bounds, mine_area, frame)[0]
+        for area, colors in ((attack.get_dialog_area(bounds), ('red', 'green', 'yellow')),
+                             (attack.get_search_area(bounds), ('blue',))):
+            for color in colors:
+                results[f'{color}_button'] = attack.find_button(color, area, frame)
+
+    return results, (time.perf_counter() - start) * 1000
+
+
+def compare(reference, candidate, tolerance):
+    """
+    Names of the results that differ by more than tolerance pixels.
+    """
+    differences = []
+    for name, expected in reference.items():
+        found = candidate.get(name)
+        if name == 'window':
+            if (expected is None) != (found is None) or (
+                    expected is not None and max(abs(a - b) for a, b in zip(expected, found)) > tolerance):
+                differences.append(name)
+            continue
+        expected_list = [] if expected is None else (expected if isinstance(expected, list) else [expected])
+        found_list = [] if found is None else (found if isinstance(found, list) else [found])
+        if not points_match(expected_list, found_list, tolerance):
+            differences.append(name)
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare coarse-to-fine detection against full resolution')
+    parser.add_argument('--frames', type=str, required=True, help='Directory of recorded frames')
+    parser.add_argument('--scales', type=int, nargs='+', default=[2, 4], help='Coarse scales to check (default: 2 4)')
+    parser.add_argument('--upscale', type=int, default=1, help='Enlarge frames by this factor first (default: 1)')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='Allowed position difference in pixels')
+    args = parser.parse_args()
+
+    replay = ReplayCapture(args.frames)
+    checks = {scale: 0 for scale in args.scales}
+    mismatches = {scale: 0 for scale in args.scales}
+    durations = {scale: [] for scale in [1] + args.scales}
+    frames = 0
+
+    for path in replay.paths:
+        bgr, origin = replay.load(path)
+        if args.upscale > 1:
+            bgr = cv2.resize(bgr, None, fx=args.upscale, fy=args.upscale, interpolation=cv2.INTER_NEAREST)
+            origin = (origin[0] * args.upscale, origin[1] * args.upscale)
+
+        reference, ms = detect_all(bgr, origin, 1)
+        if reference['window'] is None:
+            continue
+        frames += 1
+        durations[1].append(ms)
+
+        for scale in args.scales:
+            candidate, ms = detect_all(bgr, origin, scale)
+            durations[scale].append(ms)
+            checks[scale] += len(reference)
+            differences = compare(reference, candidate, args.tolerance)
+            mismatches[scale] += len(differences)
+            for name in differences:
+                print(f"✗ {os.path.basename(path)} scale {scale} {name}: {reference[name]} vs {candidate.get(name)}")
+
+    attack.DETECTION_SCALE = 1
+    if not frames:
+        print("✗ No frames with a game window")
+        return
+
+    print("="*70)
+    print(f"Frames:      {frames} (upscaled x{args.upscale})" if args.upscale > 1 else f"Frames:      {frames}")
+    full = np.percentile(durations[1], 50)
+    print(f"scale 1      p50 {full:.2f} ms")
+    for scale in args.scales:
+        p50 = np.percentile(durations[scale], 50)
+        print(f"scale {scale}      p50 {p50:.2f} ms   ({full / p50:.1f}x)   mismatches {mismatches[scale]}/{checks[scale]}")
+    print("="*70)
+
+
+if __name__ == "__main__":
+    main()
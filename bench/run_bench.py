@@ -0,0 +1,285 @@
+"""
+Frame-replay benchmark for the detection pipeline.
+
+Reads a directory of recorded frames (PNG/NPY, see capture.py) with one
+ground-truth file per frame, <frame stem>.json:
+
+    {
+        "window": [x, y, w, h],
+        "red_marks": [[x, y], ...],
+        "green_marks": [[x, y], ...],
+        "buttons": {"red": [x, y], "green": [x, y], "yellow": [x, y], "blue": [x, y]}
+    }
+
+Buttons that are not listed are expected to be absent. Mark and button
+detectors run on the annotated window so one detector's miss does not
+cascade into the others.
+
+    python bench/run_bench.py --frames bench/frames --out report.json
+    python bench/run_bench.py --frames bench/frames --out new.json --baseline report.json
+    python bench/run_bench.py --frames bench/frames --bootstrap
+
+--bootstrap writes annotations from the current detectors for frames that have
+none yet; review and correct them by hand before trusting the numbers.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attack
+from capture import ReplayCapture
+
+BUTTON_AREAS = {'red': 'dialog', 'green': 'dialog', 'yellow': 'dialog', 'blue': 'search'}
+
+
+def load_annotation(frame_path):
+    path = os.path.splitext(frame_path)[0] + '.json'
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def reset_detector_state():
+    """
+    Forget cached window bounds and learned slots so frames are measured independently.
+    """
+    attack.window_cache['bounds'] = None
+    attack.mine_slots['positions'] = []
+    attack.mine_slots['observations'] = []
+
+
+def fresh_frame(bgr, origin):
+    return attack.Frame(bgr, origin)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def match_points(expected, detected, radius):
+    """
+    Greedy one-to-one matching. Returns (true positives, false positives, false negatives).
+    """
+    remaining = [tuple(p) for p in detected]
+    tp = 0
+    for ex, ey in expected:
+        if not remaining:
+            break
+        best = min(remaining, key=lambda p: (p[0] - ex) ** 2 + (p[1] - ey) ** 2)
+        if (best[0] - ex) ** 2 + (best[1] - ey) ** 2 <= radius ** 2:
+            tp += 1
+            remaining.remove(best)
+    return tp, len(detected) - tp, len(expected) - tp
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    union = aw * ah + bw * bh - w * h
+    return w * h / union if union else 0.0
+
+
+def summarize_latency(values):
+    values = np.array(values)
+    return {
+        'count': int(len(values)),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99))
+    }
+
+
+def summarize_accuracy(counts):
+    tp, fp, fn = counts
+    return {
+        'tp': tp, 'fp': fp, 'fn': fn,
+        'precision': tp / (tp + fp) if tp + fp else 1.0,
+        'recall': tp / (tp + fn) if tp + fn else 1.0
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def bootstrap_annotations(replay):
+    """
+    Write annotations from the current detectors for frames that have none.
+    """
+    written = 0
+    for path in replay.paths:
+        if load_annotation(path) is not None:
+            continue
+        reset_detector_state()
+        bgr, origin = replay.load(path)
+        frame = fresh_frame(bgr, origin)
+        game_bounds, _ = attack.find_game_window(frame)
+        if game_bounds is None:
+            continue
+
+        mine_area = attack.get_mine_area(game_bounds)
+        areas = {'dialog': attack.get_dialog_area(game_bounds), 'search': attack.get_search_area(game_bounds)}
+        buttons = {}
+        for color, area in BUTTON_AREAS.items():
+            button = attack.find_button(color, areas[area], frame)
+            if button:
+                buttons[color] = list(button)
+
+        annotation = {
+            'window': list(game_bounds),
+            'red_marks': [list(p) for p in attack.detect_red_marks(game_bounds, mine_area, frame)[0]],
+            'green_marks': [list(p) for p in attack.detect_green_marks(game_bounds, mine_area, frame)[0]],
+            'buttons': buttons
+        }
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump(annotation, f, indent=2)
+        written += 1
+
+    print(f"✓ Wrote {written} annotation files")
+
+
+def run(replay, repeat, radius):
+    latency = {name: [] for name in ('find_game_window', 'detect_red_marks', 'detect_green_marks', 'find_button', 'detect_mines')}
+    accuracy = {name: [0, 0, 0] for name in ('window', 'red_marks', 'green_marks', 'buttons')}
+    frames = 0
+
+    for path in replay.paths:
+        annotation = load_annotation(path)
+        if annotation is None:
+            continue
+        frames += 1
+        bgr, origin = replay.load(path)
+
+        game_bounds = tuple(annotation['window'])
+        mine_area = attack.get_mine_area(game_bounds)
+        areas = {'dialog': attack.get_dialog_area(game_bounds), 'search': attack.get_search_area(game_bounds)}
+
+        for _ in range(repeat):
+            reset_detector_state()
+            detected_window, ms = timed(lambda: attack.find_game_window(fresh_frame(bgr, origin))[0])
+            latency['find_game_window'].append(ms)
+
+            red, ms = timed(lambda: attack.detect_red_marks(game_bounds, mine_area, fresh_frame(bgr, origin))[0])
+            latency['detect_red_marks'].append(ms)
+
+            green, ms = timed(lambda: attack.detect_green_marks(game_bounds, mine_area, fresh_frame(bgr, origin))[0])
+            latency['detect_green_marks'].append(ms)
+
+            buttons = {}
+            for color, area in BUTTON_AREAS.items():
+                buttons[color], ms = timed(attack.find_button, color, areas[area], fresh_frame(bgr, origin))
+                latency['find_button'].append(ms)
+
+            reset_detector_state()
+            _, ms = timed(attack.detect_mines, fresh_frame(bgr, origin))
+            latency['detect_mines'].append(ms)
+
+        # Accuracy from the last repetition (detectors are deterministic)
+        if detected_window is not None and iou(detected_window, game_bounds) >= 0.9:
+            accuracy['window'][0] += 1
+        else:
+            accuracy['window'][2] += 1
+            if detected_window is not None:
+                accuracy['window'][1] += 1
+
+        for name, detected in (('red_marks', red), ('green_marks', green)):
+            for i, value in enumerate(match_points(annotation.get(name, []), detected, radius)):
+                accuracy[name][i] += value
+
+        expected_buttons = annotation.get('buttons', {})
+        for color in BUTTON_AREAS:
+            expected = [expected_buttons[color]] if color in expected_buttons else []
+            detected = [buttons[color]] if buttons[color] else []
+            for i, value in enumerate(match_points(expected, detected, radius)):
+                accuracy['buttons'][i] += value
+
+    tick_ms = np.mean(latency['detect_mines']) if latency['detect_mines'] else 0.0
+    return {
+        'revision': git_revision(),
+        'frames': frames,
+        'repeat': repeat,
+        'match_radius': radius,
+        'latency_ms': {name: summarize_latency(values) for name, values in latency.items() if values},
+        'fps': 1000.0 / tick_ms if tick_ms else 0.0,
+        'accuracy': {name: summarize_accuracy(counts) for name, counts in accuracy.items()}
+    }
+
+
+def print_report(report, baseline=None):
+    def delta(section, name, key):
+        if baseline is None or name not in baseline.get(section, {}):
+            return ''
+        old = baseline[section][name][key]
+        new = report[section][name][key]
+        if section == 'latency_ms':
+            return f"  ({(new - old) / old * 100:+.1f}%)" if old else ''
+        return f"  ({new - old:+.3f})"
+
+    print("="*70)
+    print(f"DETECTION BENCHMARK  rev {report['revision']}  frames {report['frames']}  x{report['repeat']}")
+    if baseline is not None:
+        print(f"Baseline rev {baseline['revision']}")
+    print("="*70)
+    for name, values in report['latency_ms'].items():
+        print(f"{name:<20} p50 {values['p50']:8.3f} ms  p90 {values['p90']:8.3f} ms  p99 {values['p99']:8.3f} ms{delta('latency_ms', name, 'p50')}")
+    fps_change = f"  (was {baseline['fps']:.1f})" if baseline else ''
+    print(f"{'detect_mines FPS':<20} {report['fps']:.1f}{fps_change}")
+    print("-"*70)
+    for name, values in report['accuracy'].items():
+        print(f"{name:<20} precision {values['precision']:.3f}{delta('accuracy', name, 'precision')}"
+              f"   recall {values['recall']:.3f}{delta('accuracy', name, 'recall')}")
+    print("="*70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detectors on recorded, annotated frames')
+    parser.add_argument('--frames', type=str, required=True, help='Directory of frames and <stem>.json annotations')
+    parser.add_argument('--out', type=str, help='Write the JSON report here')
+    parser.add_argument('--baseline', type=str, help='Earlier JSON report to compare against')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repetitions per frame (default: 5)')
+    parser.add_argument('--radius', type=float, default=20.0, help='Match radius in pixels (default: 20)')
+    parser.add_argument('--bootstrap', action='store_true', help='Write annotations for unannotated frames and exit')
+    args = parser.parse_args()
+
+    replay = ReplayCapture(args.frames)
+
+    if args.bootstrap:
+        bootstrap_annotations(replay)
+        return
+
+    report = run(replay, args.repeat, args.radius)
+    if report['frames'] == 0:
+        print("✗ No annotated frames found (run with --bootstrap first)")
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
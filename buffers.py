@@ -0,0 +1,82 @@
+"""
+Reusable image buffers, so polling loops stop allocating a fresh BGR, HSV,
+label and mask array on every frame.
+
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV, dst=buffer_pool.take(bgr.shape))
+
+Buffers are keyed by shape and dtype (one ROI shape per region the bot
+watches). A buffer is handed out again only once nothing refers to it any
+more: not the Frame it was taken for, a crop of it, or a mask a caller kept.
+That is checked with its reference count, so nothing has to be given back
+explicitly and a result that outlives its frame is never overwritten.
+"""
+import sys
+import threading
+
+import numpy as np
+
+MAX_BUFFERS_PER_SHAPE = 8   # Beyond this many live buffers of one shape, allocate without pooling
+
+
+def _idle_refcount():
+    # References to a pooled buffer nobody else holds, counted the same way take() does
+    buffers = [np.empty(1, np.uint8)]
+    for buffer in buffers:
+        return sys.getrefcount(buffer)
+
+
+IDLE_REFCOUNT = _idle_refcount()
+
+
+class BufferPool:
+    """
+    Buffers keyed by (shape, dtype). Set enabled to False to allocate every
+    buffer afresh (the behaviour before pooling, used by bench/bench_memory.py).
+    """
+
+    def __init__(self, max_per_shape=MAX_BUFFERS_PER_SHAPE):
+        self.max_per_shape = max_per_shape
+        self.enabled = True
+        self.buffers = {}
+        self._lock = threading.Lock()
+        self.taken = 0
+        self.allocated = 0
+
+    def take(self, shape, dtype=np.uint8):
+        """
+        A buffer of this shape and dtype with undefined contents, for use as dst=.
+        """
+        shape = tuple(int(n) for n in shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            self.taken += 1
+            if not self.enabled:
+                self.allocated += 1
+                return np.empty(shape, dtype)
+
+            buffers = self.buffers.setdefault((shape, dtype.str), [])
+            for buffer in buffers:
+                if sys.getrefcount(buffer) <= IDLE_REFCOUNT:
+                    return buffer
+
+            self.allocated += 1
+            buffer = np.empty(shape, dtype)
+            if len(buffers) < self.max_per_shape:
+                buffers.append(buffer)
+            return buffer
+
+    def clear(self):
+        with self._lock:
+            self.buffers = {}
+
+    def stats(self):
+        """
+        Counters for benchmarks: buffers requested, newly allocated, and held by the pool.
+        """
+        with self._lock:
+            held = sum(len(buffers) for buffers in self.buffers.values())
+            size = sum(buffer.nbytes for buffers in self.buffers.values() for buffer in buffers)
+        return {'taken': self.taken, 'allocated': self.allocated, 'held': held, 'held_bytes': size}
+
+
+buffer_pool = BufferPool()
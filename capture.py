@@ -0,0 +1,158 @@
+"""
+Screen capture backends.
+
+Every backend exposes grab(region=None) and returns (bgr_image, origin), where
+region is a screen rectangle (x, y, w, h) and origin is the screen position of
+the returned image's top-left pixel. region=None means the whole screen.
+"""
+import os
+import re
+import glob
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+class ReplayFinished(Exception):
+    """
+    Raised by ReplayCapture when every recorded frame has been consumed.
+    """
+
+
+class ScreenCapture:
+    """
+    Live capture that grabs only the requested rectangle.
+    Uses mss when it is installed, otherwise pyautogui region screenshots.
+    With a pool (see buffers.py) the BGR images are written into reused buffers.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self._local = threading.local()
+
+    def _sct(self):
+        # mss handles are not shareable between threads
+        if not hasattr(self._local, 'sct'):
+            self._local.sct = mss.mss()
+        return self._local.sct
+
+    def grab(self, region=None):
+        if mss is not None:
+            sct = self._sct()
+            if region is None:
+                monitor = sct.monitors[0]
+                origin = (monitor['left'], monitor['top'])
+            else:
+                x, y, w, h = region
+                monitor = {'left': x, 'top': y, 'width': w, 'height': h}
+                origin = (x, y)
+            shot = np.asarray(sct.grab(monitor))
+            return cv2.cvtColor(shot, cv2.COLOR_BGRA2BGR, dst=self.buffer(shot.shape)), origin
+
+        import pyautogui
+        if region is None:
+            screenshot = pyautogui.screenshot()
+            origin = (0, 0)
+        else:
+            screenshot = pyautogui.screenshot(region=tuple(int(v) for v in region))
+            origin = (region[0], region[1])
+        rgb = np.asarray(screenshot)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=self.buffer(rgb.shape)), origin
+
+    def buffer(self, shape):
+        if self.pool is None:
+            return None
+        return self.pool.take((shape[0], shape[1], 3))
+
+
+class RecordingCapture:
+    """
+    Wrap another backend and save every grabbed frame to a directory.
+    Files are named <index>_<x>_<y>.<png|npy> so ReplayCapture can restore the origin.
+    """
+
+    def __init__(self, inner, directory, fmt='png'):
+        self.inner = inner
+        self.directory = directory
+        self.fmt = fmt
+        self.count = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def grab(self, region=None):
+        bgr, origin = self.inner.grab(region)
+
+        with self._lock:
+            index = self.count
+            self.count += 1
+
+        name = os.path.join(self.directory, f"{index:06d}_{origin[0]}_{origin[1]}.{self.fmt}")
+        if self.fmt == 'npy':
+            np.save(name, bgr)
+        else:
+            cv2.imwrite(name, bgr)
+        return bgr, origin
+
+
+class ReplayCapture:
+    """
+    Feed saved PNG/NPY frames back in order, cropping each to the requested region.
+    Plain screenshots without an encoded origin are treated as full-screen frames.
+    """
+
+    name_pattern = re.compile(r'_(-?\d+)_(-?\d+)$')
+
+    def __init__(self, directory, loop=False):
+        paths = glob.glob(os.path.join(directory, '*.png')) + glob.glob(os.path.join(directory, '*.npy'))
+        self.paths = sorted(paths)
+        self.loop = loop
+        self.index = 0
+        self._lock = threading.Lock()
+
+        if not self.paths:
+            raise FileNotFoundError(f"No .png or .npy frames found in {directory}")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def load(self, path):
+        """
+        Load one recorded frame and the screen origin encoded in its file name.
+        """
+        if path.endswith('.npy'):
+            bgr = np.load(path)
+        else:
+            bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        match = self.name_pattern.search(stem)
+        origin = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+        return bgr, origin
+
+    def next_path(self):
+        with self._lock:
+            if self.index >= len(self.paths):
+                if not self.loop:
+                    raise ReplayFinished()
+                self.index = 0
+            path = self.paths[self.index]
+            self.index += 1
+        return path
+
+    def grab(self, region=None):
+        bgr, origin = self.load(self.next_path())
+        if region is None:
+            return bgr, origin
+
+        # Crop the recorded frame down to the requested rectangle
+        x, y, w, h = region
+        ox, oy = origin
+        left, top = max(x - ox, 0), max(y - oy, 0)
+        right, bottom = max(x - ox + w, 0), max(y - oy + h, 0)
+        return bgr[top:bottom, left:right], (ox + left, oy + top)
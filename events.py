@@ -0,0 +1,201 @@
+"""
+Append-only JSONL event log, one record per search, attack, depart,
+verification and return:
+
+    {"ts": 1760780000.12, "session": "3f9c0a1b2d4e", "event": "verification",
+     "mine_id": 4, "position": [312, 455], "outcome": "success",
+     "latency_ms": {"verification": 412.0, "attack_total": 1530.5}}
+
+The file is line buffered, so every record reaches the OS as soon as it is
+written and a crash or Ctrl-C loses nothing; it is also fsynced every few
+seconds. Session totals (the CSV row) are derived from the records: the
+writer keeps running totals of its session, and remembers the byte offset
+where the session starts so its records can be read back without parsing
+the whole history.
+
+    python events.py mine_attack_events.jsonl
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from datetime import datetime
+
+FSYNC_INTERVAL = 5.0   # Seconds between fsyncs of the log file
+
+
+class EventLog:
+    """
+    Writer for one bot session. lock (e.g. a multiprocessing.Lock) keeps
+    records from several worker processes appending to one file whole.
+    Pass the id of an earlier session to continue it after a restart, and
+    the start_offset it had, so its totals are read back from there.
+    """
+
+    def __init__(self, path, lock=None, now=time.time, session=None, start_offset=None):
+        self.path = path
+        self.lock = lock
+        self.now = now
+        self.session = session or uuid.uuid4().hex[:12]
+        self.totals = SessionTotals()
+        if session is not None:
+            # Records written before the restart; only this once, not at every summary
+            for record in read_events(path, session, start_offset or 0):
+                self.totals.add(record)
+        self.file = open(path, 'a', buffering=1, encoding='utf-8')
+        # No record of this session lies before this point in the file
+        self.start_offset = (start_offset or 0) if session is not None else self.file.tell()
+        self.last_sync = time.monotonic()
+
+    def write(self, event, **fields):
+        record = {'ts': round(self.now(), 3), 'session': self.session, 'event': event}
+        record.update({key: value for key, value in fields.items() if value is not None})
+        line = json.dumps(record, separators=(', ', ': ')) + '\n'
+
+        if self.lock is not None:
+            with self.lock:
+                self.file.write(line)
+        else:
+            self.file.write(line)
+
+        self.totals.add(record)
+
+        if time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            self.sync()
+        return record
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def summary(self):
+        """
+        Totals for this session, kept up to date as records are written.
+        """
+        return self.totals.summary()
+
+    def records(self):
+        """
+        This session's records, read back from where the session starts.
+        """
+        if not self.file.closed:
+            self.file.flush()
+        return read_events(self.path, self.session, self.start_offset)
+
+
+def read_events(path, session=None, offset=0):
+    """
+    Load records from a log, optionally only those of one session and from a
+    byte offset on. A truncated last line (crash mid-write) is skipped.
+    """
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if session is None or record.get('session') == session:
+                records.append(record)
+    return records
+
+
+class SessionTotals:
+    """
+    Session totals in the same shape as attack.stats, updated one record at a time.
+    """
+
+    def __init__(self):
+        self.totals = {
+            'username': '',
+            'power': '',
+            'total_attacks': 0,
+            'successful_attacks': 0,
+            'searches_performed': 0,
+            'troops_returned': 0,
+            'finished': False
+        }
+        self.first_ts = self.last_ts = None
+
+    def add(self, record):
+        totals = self.totals
+        event, outcome = record['event'], record.get('outcome')
+        if event in ('session_start', 'session_resume'):
+            totals['username'] = record.get('username', '')
+            totals['power'] = record.get('power', '')
+            totals['finished'] = False
+        elif event == 'session_end':
+            totals['finished'] = outcome == 'finished'
+        elif event == 'attack':
+            totals['total_attacks'] += 1
+        elif event == 'verification' and outcome == 'success':
+            totals['successful_attacks'] += 1
+        elif event == 'search':
+            totals['searches_performed'] += 1
+        elif event == 'return' and outcome == 'returned':
+            totals['troops_returned'] += 1
+
+        if self.first_ts is None:
+            self.first_ts = record['ts']
+        self.last_ts = record['ts']
+
+    def summary(self):
+        summary = dict(self.totals)
+        summary['failed_attacks'] = summary['total_attacks'] - summary['successful_attacks']
+        summary['start_time'] = format_time(self.first_ts) if self.first_ts is not None else ''
+        summary['end_time'] = format_time(self.last_ts) if self.last_ts is not None else ''
+        return summary
+
+
+def summarize(records):
+    """
+    Session totals in the same shape as attack.stats.
+    """
+    totals = SessionTotals()
+    for record in records:
+        totals.add(record)
+    return totals.summary()
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize sessions from a mine attack event log')
+    parser.add_argument('log', nargs='?', default='mine_attack_events.jsonl', help='Event log (default: mine_attack_events.jsonl)')
+    args = parser.parse_args()
+
+    sessions = {}
+    for record in read_events(args.log):
+        sessions.setdefault(record['session'], []).append(record)
+
+    if not sessions:
+        print(f"✗ No events in {args.log}")
+        sys.exit(1)
+
+    print(f"{'session':<14}{'username':<16}{'power':<12}{'start':<21}{'attacks':>8}{'wins':>6}{'searches':>10}{'returns':>9}")
+    for session, records in sessions.items():
+        s = summarize(records)
+        note = '' if s['finished'] else '  (interrupted)'
+        print(f"{session:<14}{s['username']:<16}{s['power']:<12}{s['start_time']:<21}{s['total_attacks']:>8}"
+              f"{s['successful_attacks']:>6}{s['searches_performed']:>10}{s['troops_returned']:>9}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Mouse input backends and the dispatcher that drives them.
+
+Every backend exposes click(x, y) in screen coordinates. attack.py sends all
+clicks through its module-level input_backend, so the real mouse can be swapped
+for a recording no-op or a simulator (see simulator.py). The clicks are sent by
+an InputDispatcher thread, which times how long the game takes to react.
+"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+class PyAutoGUIInput:
+    """
+    Click with the real mouse through PyAutoGUI.
+    """
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+
+
+class ArbitratedInput:
+    """
+    Serialize clicks from several worker processes through one shared lock,
+    so only one bot moves the mouse at a time.
+    """
+
+    def __init__(self, inner, lock):
+        self.inner = inner
+        self.lock = lock
+
+    def click(self, x, y):
+        with self.lock:
+            self.inner.click(x, y)
+
+
+class RecordingInput:
+    """
+    Record clicks instead of sending them, e.g. to dry-run detection on the
+    live screen or to check the click sequence of a replayed session.
+    """
+
+    def __init__(self, now=time.time):
+        self.now = now
+        self.clicks = []
+
+    def click(self, x, y):
+        self.clicks.append((self.now(), x, y))
+
+
+class InputDispatcher:
+    """
+    Send input actions from a queue on one thread, in the order they were
+    queued. Each action gets a Future and a record with the times it was
+    queued, sent and (for click_and_await) seen to take effect on screen.
+
+    Consecutive clicks are kept at least gap seconds apart here, so callers do
+    not sleep after a click and can detect while it is in flight. An error in
+    the backend (e.g. PyAutoGUI's fail-safe) fails the action's Future and is
+    raised again by the next call, like DetectionPipeline does.
+    """
+
+    def __init__(self, backend, now=time.perf_counter, sleep=time.sleep, gap=0.0, profiler=None, history=1000):
+        self.backend = backend
+        self.now = now
+        self.sleep = sleep
+        self.gap = gap
+        self.profiler = profiler
+        self.queue = queue.Queue()
+        self.records = deque(maxlen=history)
+        self.latencies = {}
+        self.error = None
+        self.last_sent = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='input', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, join=True):
+        self.queue.put(None)
+        if join and self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def click(self, x, y, name='click'):
+        """
+        Queue a click. The Future resolves to the action's record once it is sent.
+        """
+        return self.submit(name, x, y, None)
+
+    def click_and_await(self, x, y, check, name='click'):
+        """
+        Queue a click followed by check(), which waits for the screen to react
+        and returns a truthy result (or None on timeout). The Future resolves to
+        that result; the time from sending the click to check() returning a
+        result is kept as the input-to-UI latency of name.
+        """
+        return self.submit(name, x, y, check)
+
+    def submit(self, name, x, y, check):
+        if self.error is not None:
+            raise self.error
+        future = Future()
+        record = {'name': name, 'x': x, 'y': y, 'queued': self.now()}
+        self.queue.put((future, record, check))
+        return future
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, record, check = item
+            if record is None:
+                # drain() marker
+                if self.error is not None:
+                    future.set_exception(self.error)
+                else:
+                    future.set_result(None)
+                continue
+            if self.error is not None:
+                future.set_exception(self.error)
+                continue
+            try:
+                future.set_result(self.perform(record, check))
+            except BaseException as e:
+                self.error = e
+                future.set_exception(e)
+
+    def perform(self, record, check):
+        if self.last_sent is not None:
+            remaining = self.last_sent + self.gap - self.now()
+            if remaining > 0:
+                self.sleep(remaining)
+
+        start = self.now()
+        self.backend.click(record['x'], record['y'])
+        record['sent'] = self.last_sent = self.now()
+        if self.profiler is not None:
+            self.profiler.add('click', 'input', start, record['sent'] - start)
+        self.records.append(record)
+        if check is None:
+            return record
+
+        result = check()
+        if result:
+            record['seen'] = self.now()
+            record['latency'] = record['seen'] - record['sent']
+            self.latencies.setdefault(record['name'], []).append(record['latency'])
+            if self.profiler is not None:
+                self.profiler.add(f"ui_latency:{record['name']}", 'ui', record['sent'], record['latency'])
+        return result
+
+    def drain(self, timeout=None):
+        """
+        Wait until every action queued so far has been performed; raises a backend error.
+        """
+        future = Future()
+        self.queue.put((future, None, None))
+        return wait_result(future, timeout)
+
+
+def wait_result(future, timeout=None, poll=0.1):
+    """
+    future.result() in short waits, so Ctrl-C still gets through on Windows.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return future.result(timeout=poll)
+        except FutureTimeout:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
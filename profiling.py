@@ -0,0 +1,170 @@
+"""
+Lightweight timing spans for finding out where a session's time goes.
+
+    with profiler.span('capture'):
+        frame = capture_frame(region)
+
+Each stage keeps a count, total, maximum, a fixed millisecond histogram and a
+bounded random sample of durations for the p50/p95 table, so memory stays
+flat however long a run is. With tracing on, every span is also kept as a
+Chrome trace event; open the *_trace.json file in chrome://tracing or
+https://ui.perfetto.dev to see the timeline. With enabled off, spans cost
+nothing beyond the with statement.
+"""
+import os
+import json
+import time
+import bisect
+import random
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Histogram bucket upper edges in milliseconds (the last bucket is open ended)
+HISTOGRAM_EDGES_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+MAX_TRACE_EVENTS = 500000   # About 100 MB of JSON; later spans are only counted
+SAMPLES_PER_STAGE = 4096    # Durations kept per stage for percentiles (reservoir sample)
+
+
+class Profiler:
+    """
+    Collects span durations per stage and, when tracing, a timeline of spans.
+    Categories: 'compute' (detection work), 'sleep', 'input' (clicks),
+    'wait' (whole waits, which contain compute and sleep spans of their own)
+    and 'ui' (time from a click until the game was seen to react).
+    """
+
+    def __init__(self, now=time.perf_counter):
+        self.now = now
+        self.enabled = True
+        self.tracing = False
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.events = []
+        self.dropped_events = 0
+        self.started = self.now()
+        self.stopped = None
+
+    def stop(self):
+        self.stopped = self.now()
+
+    def elapsed(self):
+        return (self.stopped if self.stopped is not None else self.now()) - self.started
+
+    @contextmanager
+    def span(self, name, category='compute'):
+        if not self.enabled:
+            yield
+            return
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, self.now() - start)
+
+    def add(self, name, category, start, duration):
+        """
+        Record a finished span; start is a value of now().
+        """
+        if not self.enabled:
+            return
+        ms = duration * 1000
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'category': category, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                             'counts': [0] * (len(HISTOGRAM_EDGES_MS) + 1), 'samples': []}
+            stage['count'] += 1
+            stage['total_ms'] += ms
+            stage['max_ms'] = max(stage['max_ms'], ms)
+            stage['counts'][bisect.bisect_left(HISTOGRAM_EDGES_MS, ms)] += 1
+            samples = stage['samples']
+            if len(samples) < SAMPLES_PER_STAGE:
+                samples.append(ms)
+            else:
+                # Every span so far has the same chance to be in the sample
+                slot = self._random.randrange(stage['count'])
+                if slot < SAMPLES_PER_STAGE:
+                    samples[slot] = ms
+
+            if not self.tracing:
+                return
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                self.dropped_events += 1
+                return
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round((start - self.started) * 1e6, 1),
+                'dur': round(duration * 1e6, 1),
+                'pid': os.getpid(),
+                'tid': threading.get_ident()
+            })
+
+    def summary(self):
+        """
+        Per-stage count, total, percentiles (from the sample) and a millisecond histogram.
+        """
+        with self._lock:
+            snapshot = {name: dict(stage, counts=list(stage['counts']), samples=np.array(stage['samples']))
+                        for name, stage in self.stages.items()}
+
+        stages = {}
+        for name, stage in snapshot.items():
+            stages[name] = {
+                'category': stage['category'],
+                'count': stage['count'],
+                'total_s': stage['total_ms'] / 1000,
+                'mean_ms': stage['total_ms'] / stage['count'],
+                'p50_ms': float(np.percentile(stage['samples'], 50)),
+                'p95_ms': float(np.percentile(stage['samples'], 95)),
+                'max_ms': stage['max_ms'],
+                'histogram': {'edges_ms': HISTOGRAM_EDGES_MS, 'counts': stage['counts']}
+            }
+        return stages
+
+    def shares(self, stages=None):
+        """
+        Fraction of the session spent sleeping, computing and clicking.
+        Wait spans are left out because their time is already in the others.
+        """
+        stages = self.summary() if stages is None else stages
+        elapsed = max(self.elapsed(), 1e-9)
+        totals = {'compute': 0.0, 'sleep': 0.0, 'input': 0.0}
+        for values in stages.values():
+            if values['category'] in totals:
+                totals[values['category']] += values['total_s']
+        shares = {name: total / elapsed for name, total in totals.items()}
+        shares['other'] = max(0.0, 1.0 - sum(shares.values()))
+        return shares
+
+    def write(self, prefix):
+        """
+        Save <prefix>_stages.json (histograms) and <prefix>_trace.json (Chrome trace).
+        Returns the two paths.
+        """
+        stages = self.summary()
+        stages_path = f"{prefix}_stages.json"
+        trace_path = f"{prefix}_trace.json"
+
+        directory = os.path.dirname(stages_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(stages_path, 'w') as f:
+            json.dump({'elapsed_s': self.elapsed(), 'shares': self.shares(stages), 'stages': stages}, f, indent=2)
+
+        with self._lock:
+            events = list(self.events)
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped_events}}, f)
+
+        return stages_path, trace_path
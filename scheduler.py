@@ -0,0 +1,159 @@
+"""
+Win-chance estimates for visible mines, used to pick the next target and to
+decide when a batch is not worth finishing.
+
+A mine's chance starts at DEFAULT_WIN_CHANCE and is pulled towards the win
+rate of attacks with other troop types, then of the same troop type with
+other powers, of the same --power elsewhere on the screen, and finally of that
+power on the same spot (within LOCATION_RADIUS, in fractions of the game
+window). The levels are disjoint, so every attack counts once, and each level
+only moves the estimate as far as its number of attacks allows: a handful of
+results cannot swing it. History comes from stats_db; outcomes of the running
+session are added as they happen.
+"""
+import os
+import math
+import sqlite3
+
+import stats_db
+
+DEFAULT_WIN_CHANCE = 0.5
+PRIOR_WEIGHT = 5.0        # Attacks a level needs before it counts as much as the level above
+SKIP_CONFIDENCE = 0.01    # Chance that a spot's losses are bad luck, below which it counts as worse
+LOCATION_RADIUS = 0.06    # Same spot: within this fraction of the window size
+LOCATION_BIN = 0.02       # History is grouped on a grid this fine
+
+
+class WinEstimator:
+    """
+    Shrunk win-rate estimate per mine location for one power/troop type.
+    """
+
+    def __init__(self, power=''):
+        self.power = power
+        _, self.troop_type = stats_db.split_power(power)
+        self.levels = {'all': [0, 0], 'troop': [0, 0], 'power': [0, 0]}
+        self.locations = {}   # (bin x, bin y) -> [wins, attempts] for this power
+
+    def add(self, power, troop_type, wins, attempts, location=None):
+        """
+        Count past attacks of some power/troop type, optionally at a location (fx, fy).
+        """
+        keys = ['all']
+        if troop_type == self.troop_type:
+            keys.append('troop')
+        if power == self.power:
+            keys.append('power')
+        for key in keys:
+            self.levels[key][0] += wins
+            self.levels[key][1] += attempts
+
+        if power == self.power and location is not None:
+            cell = (round(location[0] / LOCATION_BIN), round(location[1] / LOCATION_BIN))
+            counts = self.locations.setdefault(cell, [0, 0])
+            counts[0] += wins
+            counts[1] += attempts
+
+    def record(self, location, success):
+        """
+        Add one attack of the running session.
+        """
+        self.add(self.power, self.troop_type, int(success), 1, location)
+
+    def load_history(self, path=stats_db.DB_FILE):
+        """
+        Load past attacks from the statistics database. Sessions stored without
+        per-attack rows (CSV imports) still count towards the power levels.
+        Returns the number of attacks loaded.
+        """
+        if not os.path.isfile(path):
+            return 0
+
+        loaded = 0
+        db = stats_db.connect(path)
+        try:
+            rows = db.execute("""
+                SELECT s.power, s.troop_type,
+                       CAST(round(a.fx / ?) AS INTEGER) AS bx, CAST(round(a.fy / ?) AS INTEGER) AS by,
+                       SUM(a.outcome = 'success') AS wins, COUNT(*) AS attempts
+                FROM attacks a JOIN sessions s ON s.id = a.session_id
+                WHERE a.outcome IN ('success', 'failed')
+                GROUP BY s.power, s.troop_type, bx, by""", (LOCATION_BIN, LOCATION_BIN)).fetchall()
+            for row in rows:
+                location = None if row['bx'] is None else (row['bx'] * LOCATION_BIN, row['by'] * LOCATION_BIN)
+                self.add(row['power'], row['troop_type'], row['wins'], row['attempts'], location)
+                loaded += row['attempts']
+
+            rows = db.execute("""
+                SELECT power, troop_type, SUM(successful_attacks) AS wins, SUM(total_attacks) AS attempts
+                FROM sessions WHERE NOT EXISTS (SELECT 1 FROM attacks WHERE attacks.session_id = sessions.id)
+                GROUP BY power, troop_type""").fetchall()
+            for row in rows:
+                self.add(row['power'], row['troop_type'], row['wins'] or 0, row['attempts'] or 0)
+                loaded += row['attempts'] or 0
+        except sqlite3.Error as e:
+            print(f"✗ Could not load attack history: {e}")
+        finally:
+            db.close()
+        return loaded
+
+    def location_counts(self, location):
+        """
+        [wins, attempts] of this power within LOCATION_RADIUS of a location.
+        """
+        fx, fy = location
+        reach = int(LOCATION_RADIUS / LOCATION_BIN)
+        bx, by = round(fx / LOCATION_BIN), round(fy / LOCATION_BIN)
+        wins = attempts = 0
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                if (dx * dx + dy * dy) * LOCATION_BIN ** 2 > LOCATION_RADIUS ** 2:
+                    continue
+                counts = self.locations.get((bx + dx, by + dy))
+                if counts:
+                    wins += counts[0]
+                    attempts += counts[1]
+        return wins, attempts
+
+    def estimate(self, location=None):
+        """
+        Chance of winning a mine at location (fx, fy), or at an unknown spot if None.
+        """
+        # The levels are nested (all > troop > power > spot); only use what each adds
+        nested = [self.levels['all'], self.levels['troop'], self.levels['power']]
+        if location is not None:
+            nested.append(self.location_counts(location))
+        nested.append((0, 0))
+
+        chance = DEFAULT_WIN_CHANCE
+        for outer, inner in zip(nested, nested[1:]):
+            wins, attempts = outer[0] - inner[0], outer[1] - inner[1]
+            chance = (wins + PRIOR_WEIGHT * chance) / (attempts + PRIOR_WEIGHT)
+        return chance
+
+    def spot_is_worse(self, location):
+        """
+        True if the attacks with this power near location lost too often to be
+        bad luck: at most SKIP_CONFIDENCE likely at the win rate elsewhere.
+        """
+        wins, attempts = self.location_counts(location)
+        other_wins = self.levels['power'][0] - wins
+        other_attempts = self.levels['power'][1] - attempts
+        if not attempts or not other_attempts:
+            return False
+        rate = other_wins / other_attempts
+        chance = sum(math.comb(attempts, k) * rate ** k * (1 - rate) ** (attempts - k) for k in range(wins + 1))
+        return chance <= SKIP_CONFIDENCE
+
+    def worth_skipping(self, locations, min_win_chance):
+        """
+        True if a batch with mines at these locations should be left for a new
+        one: every mine is estimated below min_win_chance, a mine at an unknown
+        spot is not, and each mine's spot has lost significantly more often than
+        the rest. When every spot looks alike a new batch is no better, so
+        nothing is skipped.
+        """
+        if not locations or self.estimate() < min_win_chance:
+            return False
+        return all(self.estimate(location) < min_win_chance and self.spot_is_worse(location)
+                   for location in locations)
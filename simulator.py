@@ -0,0 +1,342 @@
+"""
+Headless game simulator for end-to-end throughput testing of hit_mines().
+
+Renders synthetic advanced mithril screens (tan window, red X / green check
+marks, ATTACK/DEPART/RETURN/SEARCH buttons), reacts to clicks, models attack
+outcomes and UI latencies, and runs on a virtual clock so the bot's sleeps do
+not block. Needs no display and no game:
+
+    python simulator.py --searches 1000 --win-rate 0.6
+    python simulator.py --searches 20 --record recordings/sim
+"""
+import time
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+import attack
+from capture import RecordingCapture
+
+# Colors (BGR) chosen to fall inside attack.COLOR_RANGES
+DESKTOP = (45, 40, 40)
+TAN = (150, 200, 225)
+TREE = (20, 45, 25)
+MINE = (95, 105, 115)
+PANEL = (60, 60, 70)
+RED = (0, 0, 225)
+GREEN = (0, 190, 0)
+YELLOW = (0, 200, 255)
+BLUE = (230, 120, 30)
+WHITE = (255, 255, 255)
+
+# Mine slots as fractions of the game window, like the real screen
+SLOTS = [(0.3, 0.3), (0.7, 0.3), (0.3, 0.58), (0.7, 0.58)]
+
+
+class VirtualClock:
+    """
+    Clock whose sleeps return immediately and only advance virtual time.
+    With include_compute, real elapsed time (detection cost) is added too.
+    """
+
+    def __init__(self, include_compute=True):
+        self.include_compute = include_compute
+        self.start = time.time()
+        self.real_start = time.perf_counter()
+        self.slept = 0.0
+
+    def time(self):
+        elapsed = time.perf_counter() - self.real_start if self.include_compute else 0.0
+        return self.start + elapsed + self.slept
+
+    def sleep(self, seconds):
+        self.slept += max(seconds, 0.0)
+
+    def perf_counter(self):
+        elapsed = time.perf_counter() - self.real_start if self.include_compute else 0.0
+        return elapsed + self.slept
+
+
+class SimulatedGame:
+    """
+    Game state machine that doubles as a capture backend (grab) and an input
+    backend (click) for attack.py.
+    """
+
+    def __init__(self, clock, screen=(1280, 1000), window=(20, 40, 540, 900), win_rate=0.5,
+                 ui_latency=0.3, march_time=0.8, search_time=1.0, dialog_close_time=0.0, seed=0):
+        self.clock = clock
+        self.screen = screen
+        self.window = window
+        self.win_rate = win_rate
+        self.ui_latency = ui_latency
+        self.march_time = march_time
+        self.search_time = search_time
+        self.dialog_close_time = dialog_close_time
+        self.rng = np.random.default_rng(seed)
+
+        self.mines = []          # per slot: {'state': 'red'|'green'|'empty', 'win_prob': float}
+        self.dialog = None       # None or (kind, slot) with kind in attack/depart/return
+        self.idle_troops = 1
+        self.events = []         # (time, callback) applied once the clock passes them
+        self.version = 0
+        self._rendered = (None, None)
+        self.lock = threading.RLock()   # capture and input may come from different threads
+
+        self.counters = {'clicks': 0, 'missed_clicks': 0, 'battles': 0, 'wins': 0, 'searches': 0}
+        self.new_mines()
+
+    # State changes
+
+    def schedule(self, delay, callback):
+        self.events.append((self.clock.time() + delay, callback))
+
+    def update(self):
+        now = self.clock.time()
+        due = sorted((e for e in self.events if e[0] <= now), key=lambda e: e[0])
+        if not due:
+            return
+        self.events = [e for e in self.events if e[0] > now]
+        for _, callback in due:
+            callback()
+            self.version += 1
+
+    def new_mines(self):
+        count = int(self.rng.integers(2, len(SLOTS) + 1))
+        used = set(self.rng.choice(len(SLOTS), size=count, replace=False).tolist())
+        self.mines = []
+        for slot in range(len(SLOTS)):
+            win_prob = float(np.clip(self.rng.normal(self.win_rate, 0.2), 0.0, 1.0))
+            self.mines.append({'state': 'red' if slot in used else 'empty', 'win_prob': win_prob})
+        self.idle_troops = 1
+        self.version += 1
+
+    def set_dialog(self, dialog):
+        self.dialog = dialog
+
+    def close_dialog(self):
+        # Dialogs confirmed with their button fade out and stay on screen meanwhile
+        if self.dialog_close_time > 0:
+            self.schedule(self.dialog_close_time, lambda: self.set_dialog(None))
+        else:
+            self.dialog = None
+
+    def battle(self, slot):
+        mine = self.mines[slot]
+        self.counters['battles'] += 1
+        if mine['state'] == 'red' and self.rng.random() < mine['win_prob']:
+            mine['state'] = 'green'
+            self.counters['wins'] += 1
+        else:
+            self.idle_troops += 1
+
+    def return_troop(self, slot):
+        if self.mines[slot]['state'] == 'green':
+            self.mines[slot]['state'] = 'empty'
+            self.idle_troops += 1
+
+    # Geometry
+
+    def slot_mark(self, slot):
+        x, y, w, h = self.window
+        fx, fy = SLOTS[slot]
+        return (x + int(fx * w), y + int(fy * h))
+
+    def dialog_panel(self):
+        x, y, w, h = self.window
+        return (x + int(w * 0.25), y + int(h * 0.32), int(w * 0.5), int(h * 0.36))
+
+    def dialog_button(self):
+        px, py, pw, ph = self.dialog_panel()
+        return (px + pw // 2 - 75, py + ph - 80, 150, 50)
+
+    def search_button(self):
+        x, y, w, h = self.window
+        return (x + w // 2 - 100, y + int(h * 0.85), 200, 60)
+
+    @staticmethod
+    def inside(point, rect):
+        px, py = point
+        x, y, w, h = rect
+        return x <= px < x + w and y <= py < y + h
+
+    # Input backend
+
+    def click(self, x, y):
+        with self.lock:
+            self.handle_click(x, y)
+
+    def handle_click(self, x, y):
+        self.update()
+        self.counters['clicks'] += 1
+
+        if self.dialog is not None:
+            kind, slot = self.dialog
+            if not self.inside((x, y), self.dialog_button()):
+                self.dialog = None
+                self.version += 1
+                return
+            if kind == 'attack':
+                self.schedule(self.ui_latency, lambda: self.set_dialog(('depart', slot)))
+            elif kind == 'depart':
+                self.close_dialog()
+                if self.idle_troops > 0:
+                    self.idle_troops -= 1
+                    self.schedule(self.march_time, lambda: self.battle(slot))
+            elif kind == 'return':
+                self.close_dialog()
+                self.schedule(self.ui_latency, lambda: self.return_troop(slot))
+            self.version += 1
+            return
+
+        if self.inside((x, y), self.search_button()):
+            self.counters['searches'] += 1
+            self.schedule(self.search_time, self.new_mines)
+            return
+
+        for slot, mine in enumerate(self.mines):
+            mx, my = self.slot_mark(slot)
+            if mine['state'] != 'empty' and (x - mx) ** 2 + (y - my - 30) ** 2 <= 40 ** 2:
+                kind = 'attack' if mine['state'] == 'red' else 'return'
+                self.schedule(self.ui_latency, lambda kind=kind, slot=slot: self.set_dialog((kind, slot)))
+                return
+
+        self.counters['missed_clicks'] += 1
+
+    # Capture backend
+
+    def render(self):
+        if self._rendered[0] == self.version:
+            return self._rendered[1]
+
+        width, height = self.screen
+        img = np.full((height, width, 3), DESKTOP, np.uint8)
+        x, y, w, h = self.window
+        img[y:y + h, x:x + w] = TAN
+
+        # Scenery away from the window border
+        for fx, fy in ((0.08, 0.12), (0.9, 0.1), (0.07, 0.75), (0.92, 0.7)):
+            cv2.circle(img, (x + int(fx * w), y + int(fy * h)), 18, TREE, -1)
+
+        for slot, mine in enumerate(self.mines):
+            if mine['state'] == 'empty':
+                continue
+            mx, my = self.slot_mark(slot)
+            cv2.rectangle(img, (mx - 28, my + 15), (mx + 28, my + 50), MINE, -1)
+            if mine['state'] == 'red':
+                cv2.line(img, (mx - 14, my - 14), (mx + 14, my + 14), RED, 7)
+                cv2.line(img, (mx + 14, my - 14), (mx - 14, my + 14), RED, 7)
+            else:
+                cv2.polylines(img, [np.array([(mx - 14, my), (mx - 4, my + 10), (mx + 16, my - 14)])], False, GREEN, 7)
+
+        bx, by, bw, bh = self.search_button()
+        cv2.rectangle(img, (bx, by), (bx + bw, by + bh), BLUE, -1)
+        cv2.putText(img, 'SEARCH', (bx + 45, by + 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, WHITE, 2)
+
+        if self.dialog is not None:
+            kind, _ = self.dialog
+            px, py, pw, ph = self.dialog_panel()
+            cv2.rectangle(img, (px, py), (px + pw, py + ph), PANEL, -1)
+            color, label = {'attack': (RED, 'ATTACK'), 'depart': (GREEN, 'DEPART'), 'return': (YELLOW, 'RETURN')}[kind]
+            bx, by, bw, bh = self.dialog_button()
+            cv2.rectangle(img, (bx, by), (bx + bw, by + bh), color, -1)
+            cv2.putText(img, label, (bx + 25, by + 35), cv2.FONT_HERSHEY_SIMPLEX, 0.8, WHITE, 2)
+
+        self._rendered = (self.version, img)
+        return img
+
+    def grab(self, region=None):
+        with self.lock:
+            self.update()
+            img = self.render()
+        if region is None:
+            return img, (0, 0)
+
+        x, y, w, h = region
+        left, top = max(x, 0), max(y, 0)
+        return img[top:max(y + h, 0), left:max(x + w, 0)], (left, top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run hit_mines against a simulated game')
+    parser.add_argument('-s', '--searches', type=int, default=100, help='Maximum number of searches (default: 100)')
+    parser.add_argument('--win-rate', type=float, default=0.5, help='Average chance to win a mine (default: 0.5)')
+    parser.add_argument('--ui-latency', type=float, default=0.3, help='Seconds for a dialog to react (default: 0.3)')
+    parser.add_argument('--march-time', type=float, default=0.8, help='Seconds from DEPART to the battle result (default: 0.8)')
+    parser.add_argument('--search-time', type=float, default=1.0, help='Seconds for SEARCH to show new mines (default: 1.0)')
+    parser.add_argument('--dialog-close-time', type=float, default=0.0,
+                        help='Seconds a confirmed dialog stays on screen (default: 0.0)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--pure-virtual', action='store_true', help='Do not count real compute time in the virtual clock')
+    parser.add_argument('--record', type=str, metavar='DIR', help='Save every rendered frame the bot captures to DIR')
+    parser.add_argument('--pipeline', action='store_true', help='Run capture and detection on a separate thread')
+    parser.add_argument('--profile', type=str, nargs='?', const='profile', metavar='PREFIX',
+                        help='Save stage histograms and a Chrome trace (virtual time) with this path prefix')
+    parser.add_argument('--events', type=str, metavar='FILE', help='Append the per-attack event log to FILE')
+    parser.add_argument('--min-win-chance', type=float, default=attack.MIN_WIN_CHANCE,
+                        help=f'Search early below this estimated win chance (default: {attack.MIN_WIN_CHANCE})')
+    parser.add_argument('--history', type=str, metavar='DB',
+                        help='Load past attacks from this statistics database (default: none)')
+    parser.add_argument('--coarse-scale', type=int, choices=[1, 2, 4], default=1,
+                        help='Coarse-to-fine detection at 1/N size (default: 1, off)')
+    args = parser.parse_args()
+
+    clock = VirtualClock(include_compute=not args.pure_virtual)
+    game = SimulatedGame(clock, win_rate=args.win_rate, ui_latency=args.ui_latency,
+                         march_time=args.march_time, search_time=args.search_time, dialog_close_time=args.dialog_close_time,
+                         seed=args.seed)
+
+    attack.clock = clock
+    attack.BUTTON_TEMPLATE_FILE = None   # Learn templates in memory, never into the real cache
+    attack.DETECTION_SCALE = args.coarse_scale
+    attack.input_backend = game
+    attack.capture_backend = RecordingCapture(game, args.record) if args.record else game
+
+    username, power = 'simulator', f"win{args.win_rate:.2f}"
+    attack.stats['start_time'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(clock.time()))
+    virtual_start = clock.time()
+    real_start = time.perf_counter()
+
+    attack.profiler.reset()
+    attack.profiler.tracing = args.profile is not None
+    if args.events:
+        attack.EVENT_LOG_FILE = args.events
+        attack.open_event_log(username, power)
+    
+    pipeline = attack.DetectionPipeline().start() if args.pipeline else None
+    try:
+        attack.hit_mines(username, power, max_searches=args.searches, pipeline=pipeline, min_win_chance=args.min_win_chance,
+                          history_db=args.history)
+        attack.stop_input_dispatcher()
+    finally:
+        attack.stop_input_dispatcher(wait=False)
+        if pipeline is not None:
+            pipeline.stop()
+        attack.profiler.stop()
+        attack.close_event_log()
+
+    virtual_minutes = (clock.time() - virtual_start) / 60
+    real_seconds = time.perf_counter() - real_start
+    attack.stats['end_time'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(clock.time()))
+    attack.print_statistics(username, power)
+
+    print("SIMULATION")
+    print("="*70)
+    print(f"Virtual Time:        {virtual_minutes:.1f} min (real {real_seconds:.1f} s)")
+    print(f"Attacks per Minute:  {attack.stats['total_attacks'] / max(virtual_minutes, 1e-9):.2f}")
+    print(f"Wins per Hour:       {attack.stats['successful_attacks'] / max(virtual_minutes, 1e-9) * 60:.1f}")
+    print(f"Simulated Battles:   {game.counters['battles']} ({game.counters['wins']} won)")
+    print(f"Clicks:              {game.counters['clicks']} ({game.counters['missed_clicks']} missed)")
+    print("="*70)
+    if pipeline is not None:
+        attack.print_pipeline_metrics(pipeline)
+    attack.print_profile_summary()
+    if args.profile is not None:
+        stages_path, trace_path = attack.profiler.write(args.profile)
+        print(f"✓ Profile saved to {stages_path} and {trace_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+SQLite store for finished sessions and their individual attacks.
+
+attack.py records every session here (next to the CSV row), and
+`python attack.py stats` reports on it:
+
+    python attack.py stats
+    python attack.py stats -u John --since 2025-01-01
+    python attack.py stats --import-events mine_attack_events.jsonl
+
+Rows of the old mine_attack_statistics.csv (';' or ',' separated) are imported
+the first time they are seen, so nothing has to be migrated by hand.
+"""
+import os
+import re
+import csv
+import sqlite3
+import argparse
+from datetime import datetime
+
+import events
+
+DB_FILE = 'mine_attack_statistics.db'
+CSV_FILE = 'mine_attack_statistics.csv'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    session TEXT UNIQUE,           -- event log session id, NULL for CSV imports
+    username TEXT NOT NULL,
+    power TEXT NOT NULL,
+    power_value INTEGER,           -- 484 for '484Fire'
+    troop_type TEXT,               -- 'Fire' for '484Fire'
+    start_time TEXT,
+    end_time TEXT,
+    duration_s REAL,
+    total_attacks INTEGER NOT NULL DEFAULT 0,
+    successful_attacks INTEGER NOT NULL DEFAULT 0,
+    failed_attacks INTEGER NOT NULL DEFAULT 0,
+    searches_performed INTEGER NOT NULL DEFAULT 0,
+    troops_returned INTEGER NOT NULL DEFAULT 0,
+    source TEXT NOT NULL,          -- 'live', 'csv' or 'events'
+    UNIQUE (username, start_time, end_time)
+);
+CREATE TABLE IF NOT EXISTS attacks (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    ts REAL NOT NULL,
+    mine_id INTEGER,
+    x INTEGER,
+    y INTEGER,
+    fx REAL,                       -- mine position as a fraction of the game window
+    fy REAL,
+    outcome TEXT NOT NULL,         -- 'success', 'failed', 'no_attack_button', 'no_depart_button', 'dialog_open'
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (start_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username, start_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_power ON sessions (troop_type, power_value, start_time);
+CREATE INDEX IF NOT EXISTS idx_attacks_session ON attacks (session_id);
+CREATE INDEX IF NOT EXISTS idx_attacks_ts ON attacks (ts);
+"""
+
+SESSION_COLUMNS = ['session', 'username', 'power', 'power_value', 'troop_type', 'start_time', 'end_time', 'duration_s',
+                   'total_attacks', 'successful_attacks', 'failed_attacks', 'searches_performed', 'troops_returned',
+                   'source']
+
+power_pattern = re.compile(r'^\s*(\d+)\s*(.*?)\s*$')
+
+
+def connect(path=DB_FILE):
+    """
+    Open (and create if needed) the statistics database.
+    """
+    db = sqlite3.connect(path, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+
+    # Databases created before mine locations were stored
+    columns = [row['name'] for row in db.execute("PRAGMA table_info(attacks)")]
+    for column in ('fx', 'fy'):
+        if column not in columns:
+            db.execute(f"ALTER TABLE attacks ADD COLUMN {column} REAL")
+    return db
+
+
+def split_power(power):
+    """
+    '484Fire' -> (484, 'Fire'). Values without a leading number keep the text as the type.
+    """
+    match = power_pattern.match(power or '')
+    if match is None:
+        return None, (power or '').strip()
+    return int(match.group(1)), match.group(2)
+
+
+def duration_seconds(start_time, end_time):
+    try:
+        start = datetime.strptime(start_time, TIME_FORMAT)
+        end = datetime.strptime(end_time, TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    return max((end - start).total_seconds(), 0.0)
+
+
+def insert_session(db, summary, source, session=None, attacks=(), replace=False):
+    """
+    Store one session and its attacks. A session that is already stored (same
+    event log session, or same username, start and end time) is skipped, or
+    with replace=True overwritten (a resumed session saved again).
+    Returns True if inserted.
+    """
+    if replace and session is not None:
+        old = db.execute("SELECT id FROM sessions WHERE session = ?", (session,)).fetchone()
+        if old is not None:
+            db.execute("DELETE FROM attacks WHERE session_id = ?", (old['id'],))
+            db.execute("DELETE FROM sessions WHERE id = ?", (old['id'],))
+
+    power_value, troop_type = split_power(summary['power'])
+    row = {
+        'session': session,
+        'power_value': power_value,
+        'troop_type': troop_type,
+        'duration_s': duration_seconds(summary['start_time'], summary['end_time']),
+        'source': source
+    }
+    for key in SESSION_COLUMNS:
+        if key not in row:
+            row[key] = summary[key]
+
+    placeholders = ', '.join('?' for _ in SESSION_COLUMNS)
+    cursor = db.execute(f"INSERT OR IGNORE INTO sessions ({', '.join(SESSION_COLUMNS)}) VALUES ({placeholders})",
+                        [row[key] for key in SESSION_COLUMNS])
+    if cursor.rowcount == 0:
+        return False
+
+    db.executemany("INSERT INTO attacks (session_id, ts, mine_id, x, y, fx, fy, outcome, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   [(cursor.lastrowid,) + tuple(attack) for attack in attacks])
+    return True
+
+
+def attacks_from_events(records):
+    """
+    One (ts, mine_id, x, y, fx, fy, outcome, latency_ms) row per attack attempt in a session's event records.
+    """
+    rows = []
+    for record in records:
+        event, outcome = record['event'], record.get('outcome')
+        if event == 'verification':
+            pass
+        elif event == 'attack' and outcome == 'no_button':
+            outcome = 'no_attack_button'
+        elif event == 'depart' and outcome == 'no_button':
+            outcome = 'no_depart_button'
+        else:
+            continue
+        x, y = record.get('position') or (None, None)
+        fx, fy = record.get('location') or (None, None)
+        rows.append((record['ts'], record.get('mine_id'), x, y, fx, fy, outcome, record.get('latency_ms', {}).get('attack_total')))
+    return rows
+
+
+def record_session(summary, event_log=None, path=DB_FILE):
+    """
+    Store a session, with per-attack rows when its event log is available.
+    Storing the same event log session again replaces the earlier row.
+    """
+    attacks, session = (), None
+    if event_log is not None:
+        # Only the part of the log written since the session started
+        attacks = attacks_from_events(event_log.records())
+        session = event_log.session
+
+    db = connect(path)
+    try:
+        with db:
+            insert_session(db, summary, 'live', session, attacks, replace=True)
+    finally:
+        db.close()
+
+
+def sniff_delimiter(header):
+    """
+    Delimiter of one CSV line: the committed header uses ';', older attack.py wrote ','.
+    """
+    return ';' if header.count(';') > header.count(',') else ','
+
+
+def read_csv_sessions(path):
+    """
+    Session summaries from a statistics CSV. The delimiter is picked per line,
+    since older versions appended ',' rows under a ';' header.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return
+
+    fieldnames = [name.strip() for name in next(csv.reader([lines[0]], delimiter=sniff_delimiter(lines[0])))]
+    for text in lines[1:]:
+        values = next(csv.reader([text], delimiter=sniff_delimiter(text)))
+        line = dict(zip(fieldnames, values))
+        if not line.get('username'):
+            continue
+        summary = {key: (line.get(key) or '').strip() for key in ('username', 'power', 'start_time', 'end_time')}
+        if not summary['end_time']:
+            summary['end_time'] = (line.get('date_time') or '').strip()
+        for key in ('total_attacks', 'successful_attacks', 'failed_attacks', 'searches_performed', 'troops_returned'):
+            try:
+                summary[key] = int(line.get(key) or 0)
+            except ValueError:
+                summary[key] = 0
+        yield summary
+
+
+def import_csv(db, path=CSV_FILE):
+    """
+    Import CSV rows that are not in the database yet. Returns how many were added.
+    """
+    if not os.path.isfile(path):
+        return 0
+    with db:
+        return sum(insert_session(db, summary, 'csv') for summary in read_csv_sessions(path))
+
+
+def import_events(db, path):
+    """
+    Import every session of an event log, including interrupted ones. Returns how many were added.
+    """
+    sessions = {}
+    for record in events.read_events(path):
+        sessions.setdefault(record['session'], []).append(record)
+
+    added = 0
+    with db:
+        for session, records in sessions.items():
+            summary = events.summarize(records)
+            added += insert_session(db, summary, 'events', session, attacks_from_events(records))
+    return added
+
+
+def session_filter(username=None, since=None, until=None):
+    """
+    WHERE clause and parameters for the report filters.
+    """
+    clauses, params = [], []
+    if username:
+        clauses.append('username = ?')
+        params.append(username)
+    if since:
+        clauses.append('start_time >= ?')
+        params.append(since)
+    if until:
+        clauses.append('start_time < ?')
+        params.append(until)
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def report(db, username=None, since=None, until=None):
+    """
+    Success rate by power and troop type, attacks per hour and search efficiency.
+    """
+    where, params = session_filter(username, since, until)
+    totals = """
+        COUNT(*) AS sessions,
+        SUM(total_attacks) AS attacks,
+        SUM(successful_attacks) AS wins,
+        SUM(searches_performed) AS searches,
+        SUM(duration_s) AS seconds
+    """
+
+    return {
+        'by_power': db.execute(f"""
+            SELECT troop_type, power_value, {totals} FROM sessions {where}
+            GROUP BY troop_type, power_value ORDER BY troop_type, power_value""", params).fetchall(),
+        'by_username': db.execute(f"""
+            SELECT username, {totals} FROM sessions {where}
+            GROUP BY username ORDER BY username""", params).fetchall(),
+        'by_month': db.execute(f"""
+            SELECT substr(start_time, 1, 7) AS month, {totals} FROM sessions {where}
+            GROUP BY month ORDER BY month""", params).fetchall(),
+        'overall': db.execute(f"SELECT {totals} FROM sessions {where}", params).fetchone()
+    }
+
+
+def rate(part, whole):
+    return f"{(part or 0) / whole * 100:5.1f}%" if whole else '    -'
+
+
+def per_hour(count, seconds):
+    return f"{(count or 0) / (seconds / 3600):7.1f}" if seconds else '      -'
+
+
+def per_search(count, searches):
+    return f"{(count or 0) / searches:6.2f}" if searches else '     -'
+
+
+def print_report(result):
+    def print_rows(title, rows, label):
+        print(title)
+        print("-"*70)
+        print(f"{'':<20}{'sessions':>9}{'attacks':>9}{'success':>9}{'att/hour':>10}{'att/srch':>10}{'win/srch':>10}")
+        for row in rows:
+            print(f"{label(row):<20}{row['sessions']:>9}{row['attacks'] or 0:>9}{rate(row['wins'], row['attacks']):>9}"
+                  f"{per_hour(row['attacks'], row['seconds']):>10}{per_search(row['attacks'], row['searches']):>10}"
+                  f"{per_search(row['wins'], row['searches']):>10}")
+        print()
+
+    overall = result['overall']
+    print("\n" + "="*70)
+    print("MINE ATTACK STATISTICS")
+    print("="*70)
+    if not overall['sessions']:
+        print("✗ No sessions stored yet")
+        return
+
+    print(f"Sessions:            {overall['sessions']}")
+    print(f"Attacks:             {overall['attacks']} ({rate(overall['wins'], overall['attacks']).strip()} successful)")
+    print(f"Attacks per Hour:    {per_hour(overall['attacks'], overall['seconds']).strip()}")
+    print(f"Attacks per Search:  {per_search(overall['attacks'], overall['searches']).strip()}")
+    print(f"Wins per Search:     {per_search(overall['wins'], overall['searches']).strip()}")
+    print("="*70 + "\n")
+
+    print_rows("BY POWER & TROOP TYPE", result['by_power'],
+               lambda row: f"{row['power_value'] if row['power_value'] is not None else ''}{row['troop_type'] or ''}" or '?')
+    print_rows("BY USERNAME", result['by_username'], lambda row: row['username'])
+    print_rows("BY MONTH", result['by_month'], lambda row: row['month'] or '?')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='attack.py stats', description='Report on stored mine attack sessions')
+    parser.add_argument('--db', type=str, default=DB_FILE, help=f'Database file (default: {DB_FILE})')
+    parser.add_argument('--csv', type=str, default=CSV_FILE, help=f'CSV to import new rows from (default: {CSV_FILE})')
+    parser.add_argument('--import-events', type=str, metavar='FILE', help='Also import the sessions of an event log')
+    parser.add_argument('-u', '--username', type=str, help='Only this account')
+    parser.add_argument('--since', type=str, metavar='DATE', help='Sessions starting on or after DATE (YYYY-MM-DD)')
+    parser.add_argument('--until', type=str, metavar='DATE', help='Sessions starting before DATE (YYYY-MM-DD)')
+    args = parser.parse_args(argv)
+
+    db = connect(args.db)
+    try:
+        added = import_csv(db, args.csv)
+        if added:
+            print(f"✓ Imported {added} sessions from {args.csv}")
+        if args.import_events:
+            added = import_events(db, args.import_events)
+            print(f"✓ Imported {added} sessions from {args.import_events}")
+        print_report(report(db, args.username, args.since, args.until))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()